@@ -0,0 +1,116 @@
+"""TTS 音频编解码
+
+pcm：原始 24kHz 16bit 单声道 PCM。
+adpcm：IMA ADPCM，每个样本 4 bit（约为 PCM 的 1/4），编码只需查表，浏览器端解码同样简单。
+编码结果按块组织，每块自带起始状态，可单独解码，因此流式下发的每个分片都是一个完整的块：
+
+    块头 '<IhB'：样本数 (uint32), 起始预测值 (int16), 起始步长索引 (uint8)
+    其后为 ceil(样本数 / 2) 字节，每字节低 4 位为前一个样本、高 4 位为后一个样本
+"""
+import struct
+import numpy as np
+
+CODEC_OPTIONS = ["pcm", "adpcm"]
+
+ADPCM_HEADER = struct.Struct('<IhB')
+
+_INDEX_TABLE = [-1, -1, -1, -1, 2, 4, 6, 8] * 2
+
+_STEP_TABLE = [
+    7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41, 45,
+    50, 55, 60, 66, 73, 80, 88, 97, 107, 118, 130, 143, 157, 173, 190, 209, 230,
+    253, 279, 307, 337, 371, 408, 449, 494, 544, 598, 658, 724, 796, 876, 963,
+    1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066, 2272, 2499, 2749, 3024, 3327,
+    3660, 4026, 4428, 4871, 5358, 5894, 6484, 7132, 7845, 8630, 9493, 10442,
+    11487, 12635, 13899, 15289, 16818, 18500, 20350, 22385, 24623, 27086, 29794,
+    32767
+]
+
+
+class AdpcmEncoder:
+    """IMA ADPCM 编码器，在连续的 encode 调用之间保持预测状态"""
+
+    def __init__(self):
+        self.predictor = 0
+        self.index = 0
+
+    def encode(self, pcm: bytes) -> bytes:
+        samples = np.frombuffer(pcm, dtype='<i2', count=len(pcm) // 2).tolist()
+        header = ADPCM_HEADER.pack(len(samples), self.predictor, self.index)
+
+        predictor, index = self.predictor, self.index
+        codes = bytearray((len(samples) + 1) // 2)
+        for i, sample in enumerate(samples):
+            step = _STEP_TABLE[index]
+            diff = sample - predictor
+            code = 0
+            if diff < 0:
+                code = 8
+                diff = -diff
+            delta = step >> 3
+            if diff >= step:
+                code |= 4
+                diff -= step
+                delta += step
+            step >>= 1
+            if diff >= step:
+                code |= 2
+                diff -= step
+                delta += step
+            step >>= 1
+            if diff >= step:
+                code |= 1
+                delta += step
+
+            predictor = predictor - delta if code & 8 else predictor + delta
+            predictor = -32768 if predictor < -32768 else 32767 if predictor > 32767 else predictor
+            index += _INDEX_TABLE[code]
+            index = 0 if index < 0 else 88 if index > 88 else index
+
+            if i & 1:
+                codes[i >> 1] |= code << 4
+            else:
+                codes[i >> 1] = code
+
+        self.predictor, self.index = predictor, index
+        return header + bytes(codes)
+
+
+def decode_adpcm(block: bytes) -> bytes:
+    count, predictor, index = ADPCM_HEADER.unpack_from(block)
+    codes = block[ADPCM_HEADER.size:]
+    samples = np.empty(count, dtype='<i2')
+    for i in range(count):
+        code = codes[i >> 1] >> 4 if i & 1 else codes[i >> 1] & 0x0F
+        step = _STEP_TABLE[index]
+        delta = step >> 3
+        if code & 4:
+            delta += step
+        if code & 2:
+            delta += step >> 1
+        if code & 1:
+            delta += step >> 2
+        predictor = predictor - delta if code & 8 else predictor + delta
+        predictor = -32768 if predictor < -32768 else 32767 if predictor > 32767 else predictor
+        index += _INDEX_TABLE[code]
+        index = 0 if index < 0 else 88 if index > 88 else index
+        samples[i] = predictor
+    return samples.tobytes()
+
+
+def encode(pcm: bytes, codec: str) -> bytes:
+    if codec == "adpcm":
+        return AdpcmEncoder().encode(pcm)
+    return pcm
+
+
+def decode(data: bytes, codec: str) -> bytes:
+    if codec == "adpcm":
+        return decode_adpcm(data)
+    return data
+
+
+def transcode(data: bytes, source: str, target: str) -> bytes:
+    if source == target:
+        return data
+    return encode(decode(data, source), target)
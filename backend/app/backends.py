@@ -0,0 +1,205 @@
+import os
+import shutil
+import hashlib
+import logging
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BACKEND_OPTIONS = ["torch", "onnx", "openvino"]
+
+# 导出模型缓存目录
+_MODEL_CACHE_DIR = os.path.join(os.path.dirname(__file__), '..', 'model_cache')
+
+# 与 Ultralytics 默认值一致
+MAX_DET = 300
+
+
+def model_hash(model_path: str) -> str:
+    """模型文件内容哈希，用于区分不同权重的导出产物"""
+    sha = hashlib.sha256()
+    with open(model_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(chunk)
+    return sha.hexdigest()[:12]
+
+
+def _get_export_dir(model_path: str) -> str:
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    export_dir = os.path.join(_MODEL_CACHE_DIR, f"{stem}-{model_hash(model_path)}")
+    os.makedirs(export_dir, exist_ok=True)
+    return export_dir
+
+
+def _export_onnx(model_path: str, imgsz: int, export_dir: str) -> str:
+    onnx_path = os.path.join(export_dir, f"onnx-{imgsz}.onnx")
+    if os.path.exists(onnx_path):
+        return onnx_path
+
+    from ultralytics import YOLO
+    logger.info(f"[Export] Exporting {model_path} to ONNX, imgsz={imgsz}")
+    # dynamic=True 保留可变 batch 维度，供合批推理使用
+    exported = YOLO(model_path).export(format='onnx', imgsz=imgsz, dynamic=True, verbose=False)
+    tmp_path = onnx_path + ".tmp"
+    shutil.move(exported, tmp_path)
+    os.replace(tmp_path, onnx_path)
+    return onnx_path
+
+
+def _export_openvino(model_path: str, imgsz: int, export_dir: str) -> str:
+    xml_path = os.path.join(export_dir, f"openvino-{imgsz}.xml")
+    if os.path.exists(xml_path):
+        return xml_path
+
+    import openvino as ov
+    onnx_path = _export_onnx(model_path, imgsz, export_dir)
+    logger.info(f"[Export] Converting {onnx_path} to OpenVINO IR")
+    ov.save_model(ov.convert_model(onnx_path), xml_path)
+    return xml_path
+
+
+def export_model(model_path: str, backend: str, imgsz: int) -> str:
+    """导出指定尺寸的推理引擎文件，已缓存时直接返回路径"""
+    export_dir = _get_export_dir(model_path)
+    if backend == "onnx":
+        return _export_onnx(model_path, imgsz, export_dir)
+    if backend == "openvino":
+        return _export_openvino(model_path, imgsz, export_dir)
+    raise ValueError(f"unsupported backend: {backend}")
+
+
+def nms_postprocess(pred: np.ndarray, conf: float, iou: float, classes: list = None) -> list:
+    """YOLOv8 原始输出 (B, 4 + nc, N) 的置信度过滤与按类别 NMS
+
+    返回每张图一个 (M, 6) 数组，每行为 x1, y1, x2, y2, conf, cls，与 boxes.data 一致。
+    classes 不为 None 时只保留这些类别（与 Ultralytics 的 classes 参数一致，在 NMS 之前过滤）。
+    """
+    outputs = []
+    for p in pred:
+        p = p.T
+        scores = p[:, 4:]
+        class_ids = scores.argmax(axis=1)
+        confidences = scores[np.arange(len(scores)), class_ids]
+        mask = confidences >= conf
+        if classes is not None:
+            mask &= np.isin(class_ids, classes)
+        if not mask.any():
+            outputs.append(np.zeros((0, 6), dtype=np.float32))
+            continue
+
+        xywh = p[mask, :4]
+        confidences = confidences[mask]
+        class_ids = class_ids[mask]
+        xyxy = np.empty_like(xywh)
+        xyxy[:, :2] = xywh[:, :2] - xywh[:, 2:] / 2
+        xyxy[:, 2:] = xywh[:, :2] + xywh[:, 2:] / 2
+
+        # NMSBoxesBatched 需要左上角 + 宽高格式
+        rects = np.column_stack([xyxy[:, :2], xywh[:, 2:]])
+        keep = cv2.dnn.NMSBoxesBatched(
+            rects.tolist(), confidences.tolist(), class_ids.tolist(), conf, iou
+        )
+        keep = np.asarray(keep, dtype=np.int64).reshape(-1)[:MAX_DET]
+        outputs.append(np.column_stack([
+            xyxy[keep], confidences[keep], class_ids[keep].astype(np.float32)
+        ]).astype(np.float32))
+    return outputs
+
+
+def to_input_tensor(canvases: list) -> np.ndarray:
+    """letterbox 后的 BGR 画布 -> NCHW float32 RGB 张量"""
+    batch = np.stack(canvases)[..., ::-1].transpose(0, 3, 1, 2)
+    return np.ascontiguousarray(batch, dtype=np.float32) / 255.0
+
+
+class _Engine:
+    """按 imgsz 管理导出模型：注册路径后按需加载，可单独卸载以释放内存"""
+    name = ""
+
+    def __init__(self):
+        self._paths = {}
+        self._loaded = {}
+
+    def register(self, path: str, imgsz: int):
+        self._paths[imgsz] = path
+
+    def is_loaded(self, imgsz: int) -> bool:
+        return imgsz in self._loaded
+
+    def ensure_loaded(self, imgsz: int):
+        if imgsz not in self._loaded:
+            self._loaded[imgsz] = self._load(self._paths[imgsz])
+
+    def unload(self, imgsz: int):
+        self._loaded.pop(imgsz, None)
+
+    def model_bytes(self, imgsz: int) -> int:
+        """以模型文件大小近似估算加载后的内存占用"""
+        path = self._paths[imgsz]
+        total = os.path.getsize(path)
+        weights = os.path.splitext(path)[0] + ".bin"
+        if os.path.exists(weights):
+            total += os.path.getsize(weights)
+        return total
+
+    def infer(self, tensor: np.ndarray, imgsz: int) -> np.ndarray:
+        self.ensure_loaded(imgsz)
+        return self._run(self._loaded[imgsz], tensor)
+
+    def _load(self, path: str):
+        raise NotImplementedError
+
+    def _run(self, model, tensor: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+
+class OnnxEngine(_Engine):
+    name = "onnx"
+
+    def __init__(self, intra_op_threads: int = 0, inter_op_threads: int = 0):
+        super().__init__()
+        import onnxruntime as ort
+        self._ort = ort
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+
+    def _load(self, path: str):
+        options = self._ort.SessionOptions()
+        # 0 表示交给 onnxruntime 自动选择
+        options.intra_op_num_threads = self.intra_op_threads
+        options.inter_op_num_threads = self.inter_op_threads
+        session = self._ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        return session, session.get_inputs()[0].name
+
+    def _run(self, model, tensor: np.ndarray) -> np.ndarray:
+        session, input_name = model
+        return session.run(None, {input_name: tensor})[0]
+
+
+class OpenVINOEngine(_Engine):
+    name = "openvino"
+
+    def __init__(self, intra_op_threads: int = 0, inter_op_threads: int = 0):
+        super().__init__()
+        import openvino as ov
+        self._core = ov.Core()
+        self._config = {}
+        if intra_op_threads:
+            self._config["INFERENCE_NUM_THREADS"] = intra_op_threads
+        if inter_op_threads:
+            self._config["NUM_STREAMS"] = inter_op_threads
+
+    def _load(self, path: str):
+        return self._core.compile_model(path, "CPU", self._config)
+
+    def _run(self, model, tensor: np.ndarray) -> np.ndarray:
+        return model(tensor)[model.output(0)]
+
+
+def create_engine(backend: str, intra_op_threads: int = 0, inter_op_threads: int = 0):
+    if backend == "onnx":
+        return OnnxEngine(intra_op_threads, inter_op_threads)
+    if backend == "openvino":
+        return OpenVINOEngine(intra_op_threads, inter_op_threads)
+    raise ValueError(f"unsupported backend: {backend}")
@@ -0,0 +1,198 @@
+"""检测流水线基准测试
+
+在合成的多目标场景上，对各 imgsz 与源分辨率组合分别计时 decode / preprocess /
+inference / postprocess / serialize 各阶段，输出 p50/p95/p99，并可保存为 JSON
+与其他版本的结果对比。
+"""
+import os
+import json
+import asyncio
+import time
+import logging
+import platform
+import subprocess
+import cv2
+import numpy as np
+
+from .detector import IMGSZ_OPTIONS
+from .protocol import pack_result
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RESOLUTIONS = [(640, 480), (1280, 720), (1920, 1080)]
+# 场景名 -> 拼图网格边长，网格越大目标越多越小
+SCENES = {"single": 1, "crowd_2x2": 2, "crowd_4x4": 4}
+STAGES = ["decode", "preprocess", "inference", "postprocess", "serialize"]
+
+
+def _load_tiles() -> list:
+    """加载 Ultralytics 自带的示例图片（含多人与车辆），缺失时用色块图代替"""
+    tiles = []
+    try:
+        from ultralytics.utils import ASSETS
+        for name in ("bus.jpg", "zidane.jpg"):
+            image = cv2.imread(str(ASSETS / name))
+            if image is not None:
+                tiles.append(image)
+    except Exception as e:
+        logger.warning(f"[Benchmark] Failed to load sample assets: {e}")
+
+    if not tiles:
+        rng = np.random.default_rng(0)
+        image = np.full((480, 640, 3), 200, dtype=np.uint8)
+        for _ in range(30):
+            x, y = int(rng.integers(0, 600)), int(rng.integers(0, 440))
+            color = tuple(int(c) for c in rng.integers(0, 255, 3))
+            cv2.rectangle(image, (x, y), (x + 40, y + 40), color, -1)
+        tiles.append(image)
+    return tiles
+
+
+def build_scenes(resolutions: list = None, quality: int = 80) -> list:
+    """生成 (场景名, 宽, 高, JPEG 数据) 列表"""
+    tiles = _load_tiles()
+    scenes = []
+    for width, height in resolutions or DEFAULT_RESOLUTIONS:
+        for name, grid in SCENES.items():
+            tile_w, tile_h = width // grid, height // grid
+            canvas = np.zeros((tile_h * grid, tile_w * grid, 3), dtype=np.uint8)
+            for row in range(grid):
+                for col in range(grid):
+                    tile = tiles[(row * grid + col) % len(tiles)]
+                    canvas[row * tile_h:(row + 1) * tile_h, col * tile_w:(col + 1) * tile_w] = \
+                        cv2.resize(tile, (tile_w, tile_h), interpolation=cv2.INTER_AREA)
+            canvas = cv2.resize(canvas, (width, height))
+            _, encoded = cv2.imencode('.jpg', canvas, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            scenes.append((name, width, height, encoded.tobytes()))
+    return scenes
+
+
+def parse_resolution(value: str) -> tuple:
+    """解析 "1280x720" 形式的分辨率"""
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+
+def percentiles(samples_ns: list) -> dict:
+    values = np.asarray(samples_ns, dtype=np.float64) / 1e6
+    return {
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3)
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(__file__), stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return None
+
+
+def measure_once(detector, data: bytes, conf: float, imgsz: int) -> tuple:
+    """执行一次检测与序列化，返回 (各阶段耗时 ns, 总耗时 ns, 检测数)"""
+    start = time.perf_counter_ns()
+    result = detector.detect(data, conf, columnar=True, imgsz=imgsz)
+    serialize_start = time.perf_counter_ns()
+    json.dumps(detector.to_records(result), ensure_ascii=False)
+    pack_result(0, result)
+    end = time.perf_counter_ns()
+    timings = dict(detector.last_timings)
+    timings["serialize"] = end - serialize_start
+    return timings, end - start, len(result["class_ids"])
+
+
+def _plan(imgsz_options: list, scenes: list) -> list:
+    return [(imgsz, scene) for imgsz in imgsz_options or IMGSZ_OPTIONS for scene in scenes]
+
+
+def _summarize(imgsz: int, scene: tuple, measurements: list) -> dict:
+    name, width, height, data = scene
+    samples = {stage: [] for stage in STAGES}
+    for timings, _, _ in measurements:
+        for stage in STAGES:
+            samples[stage].append(timings.get(stage, 0))
+    entry = {
+        "imgsz": imgsz,
+        "scene": name,
+        "resolution": f"{width}x{height}",
+        "jpeg_bytes": len(data),
+        "detections": measurements[-1][2],
+        "stages": {stage: percentiles(values) for stage, values in samples.items()},
+        "total": percentiles([total for _, total, _ in measurements])
+    }
+    logger.info(f"[Benchmark] imgsz={imgsz} {name} {width}x{height}: "
+                f"p50={entry['total']['p50_ms']}ms detections={entry['detections']}")
+    return entry
+
+
+def _report(detector, iterations: int, warmup: int, results: list) -> dict:
+    return {
+        "git_commit": _git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "platform": platform.platform(),
+        "device": detector.device,
+        "backend": detector.backend,
+        "iterations": iterations,
+        "warmup": warmup,
+        "results": results
+    }
+
+
+def run_benchmark(detector, imgsz_options: list = None, resolutions: list = None,
+                  iterations: int = 20, warmup: int = 3, conf: float = 0.25) -> dict:
+    """对每个 (imgsz, 场景, 分辨率) 组合执行 warmup + iterations 次检测并统计各阶段耗时"""
+    results = []
+    for imgsz, scene in _plan(imgsz_options, build_scenes(resolutions)):
+        data = scene[3]
+        for _ in range(warmup):
+            detector.detect(data, conf, columnar=True, imgsz=imgsz)
+        measurements = [measure_once(detector, data, conf, imgsz) for _ in range(iterations)]
+        results.append(_summarize(imgsz, scene, measurements))
+    return _report(detector, iterations, warmup, results)
+
+
+async def run_benchmark_async(run, detector, imgsz_options: list = None, resolutions: list = None,
+                              iterations: int = 20, warmup: int = 3, conf: float = 0.25) -> dict:
+    """与 run_benchmark 相同，但每次检测单独交给 run(func, *args) 执行
+
+    服务端传入 scheduler.run_exclusive：每次只占用推理执行器一帧的时间，
+    期间到达的实时批次在两次检测之间执行，基准测试不会长时间阻塞视频流。
+    """
+    scenes = await asyncio.to_thread(build_scenes, resolutions)
+    results = []
+    for imgsz, scene in _plan(imgsz_options, scenes):
+        data = scene[3]
+        for _ in range(warmup):
+            await run(detector.detect, data, conf, True, imgsz)
+        measurements = [await run(measure_once, detector, data, conf, imgsz) for _ in range(iterations)]
+        results.append(_summarize(imgsz, scene, measurements))
+    return _report(detector, iterations, warmup, results)
+
+
+def compare_reports(baseline: dict, current: dict) -> list:
+    """按 (imgsz, 场景, 分辨率) 对比两份报告的 p50 总耗时，返回变化列表"""
+    def key(entry):
+        return entry["imgsz"], entry["scene"], entry["resolution"]
+
+    baseline_index = {key(entry): entry for entry in baseline.get("results", [])}
+    changes = []
+    for entry in current.get("results", []):
+        base = baseline_index.get(key(entry))
+        if base is None:
+            continue
+        before = base["total"]["p50_ms"]
+        after = entry["total"]["p50_ms"]
+        changes.append({
+            "imgsz": entry["imgsz"],
+            "scene": entry["scene"],
+            "resolution": entry["resolution"],
+            "baseline_p50_ms": before,
+            "current_p50_ms": after,
+            "change_pct": round((after - before) / before * 100, 1) if before else None
+        })
+    return changes
@@ -0,0 +1,190 @@
+"""命令行工具
+
+用法（在 backend 目录下执行）:
+    python3 -m app.cli export --backend onnx
+    python3 -m app.cli export --backend openvino --imgsz 320 640
+    python3 -m app.cli benchmark --imgsz 320 640 --output bench.json
+    python3 -m app.cli benchmark --compare bench.json
+    python3 -m app.cli tts-presynth --voice Cherry Serena
+    python3 -m app.cli video input.mp4 --output result.jsonl --imgsz 640 --stride 2
+"""
+import argparse
+import asyncio
+import json
+import logging
+
+from .detector import IMGSZ_OPTIONS
+from .backends import BACKEND_OPTIONS, export_model
+
+logger = logging.getLogger(__name__)
+
+
+def _cmd_export(args):
+    from ultralytics import YOLO
+
+    model = YOLO(args.model)
+    ckpt_path = getattr(model, "ckpt_path", None) or args.model
+    for imgsz in args.imgsz:
+        path = export_model(ckpt_path, args.backend, imgsz)
+        print(f"{args.backend} imgsz={imgsz}: {path}")
+
+
+def _cmd_benchmark(args):
+    from .detector import YOLODetector
+    from .benchmark import run_benchmark, compare_reports, parse_resolution
+
+    detector = YOLODetector(args.model, backend=args.backend)
+    report = run_benchmark(
+        detector,
+        imgsz_options=args.imgsz,
+        resolutions=[parse_resolution(r) for r in args.resolutions] if args.resolutions else None,
+        iterations=args.iterations,
+        warmup=args.warmup
+    )
+
+    for entry in report["results"]:
+        stages = " ".join(f"{stage}={t['p50_ms']}" for stage, t in entry["stages"].items())
+        total = entry["total"]
+        print(f"imgsz={entry['imgsz']:<4} {entry['scene']:<10} {entry['resolution']:<10} "
+              f"det={entry['detections']:<3} p50={total['p50_ms']} p95={total['p95_ms']} "
+              f"p99={total['p99_ms']} | {stages}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Report written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"Compared with {args.compare} ({baseline.get('git_commit')}):")
+        for change in compare_reports(baseline, report):
+            print(f"imgsz={change['imgsz']:<4} {change['scene']:<10} {change['resolution']:<10} "
+                  f"{change['baseline_p50_ms']} -> {change['current_p50_ms']} ms ({change['change_pct']}%)")
+
+
+def _cmd_tts_presynth(args):
+    from . import tts_handler
+    from .tts_presynth import Presynthesizer
+
+    presynthesizer = Presynthesizer(args.concurrency)
+
+    def progress(job):
+        print(f"\r{job['voice']}: {job['completed']}/{job['total']} ({job['failed']} failed)", end="", flush=True)
+
+    for voice in args.voice or [tts_handler.get_tts_voice()]:
+        job = presynthesizer.run(voice, progress)
+        print(f"\r{voice}: {job['completed']}/{job['total']} done, {job['cached']} cached, "
+              f"{job['failed']} failed, {job['elapsed_s']}s")
+
+
+def _cmd_video(args):
+    from .config import get_section
+    from .detector import YOLODetector, parse_classes, parse_roi
+    from .scheduler import InferenceScheduler
+    from .worker_pool import DetectorProcessPool
+    from .tiling import TileSpec
+    from .video_pipeline import process_video, resolve_format
+
+    # 加载模型前检查输出格式，缺少 pyarrow 时直接报错退出
+    try:
+        fmt = resolve_format(args.output, args.format)
+    except ValueError as e:
+        raise SystemExit(f"error: {e}")
+    if not 0 <= args.conf <= 1:
+        raise SystemExit("error: --conf must be between 0 and 1")
+    if args.iou is not None and not 0 < args.iou < 1:
+        raise SystemExit("error: --iou must be between 0 and 1")
+    if args.stride < 1 or args.max_frames < 0:
+        raise SystemExit("error: --stride must be at least 1 and --max-frames 0 or positive")
+
+    detector_kwargs = {"backend": args.backend}
+    detector = YOLODetector(args.model, **detector_kwargs)
+    pool = None
+    if args.workers > 0:
+        pool = DetectorProcessPool(
+            detector, args.workers, model_path=args.model,
+            detector_kwargs=detector_kwargs, max_batch_size=args.batch
+        )
+    tile = TileSpec.from_config(get_section('tiling')) if args.tile else None
+
+    def progress(stats):
+        total = f"/{stats['total_frames'] // args.stride}" if stats["total_frames"] else ""
+        print(f"\r{stats['frames']}{total} frames, {stats['detections']} detections, "
+              f"{stats['throughput_fps']} fps", end="", flush=True)
+
+    async def run():
+        scheduler = InferenceScheduler(detector, max_batch_size=args.batch, max_wait_ms=args.max_wait_ms, pool=pool)
+        scheduler.start()
+        try:
+            return await process_video(
+                scheduler, args.source, args.output, fmt, conf=args.conf, imgsz=args.imgsz,
+                iou=args.iou, classes=parse_classes(args.classes, detector.names_en),
+                roi=parse_roi(args.roi), tile=tile, stride=args.stride, max_frames=args.max_frames,
+                queue_size=args.queue_size, progress=progress
+            )
+        finally:
+            await scheduler.stop()
+
+    try:
+        stats = asyncio.run(run())
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    print(f"\r{stats['frames']} frames, {stats['detections']} detections in {stats['elapsed_s']}s "
+          f"({stats['throughput_fps']} fps) -> {stats['output']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python3 -m app.cli", description="YOLO Vision 后端命令行工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="导出 ONNX / OpenVINO 推理引擎到 model_cache")
+    export_parser.add_argument("--model", default="yolov8n.pt", help="模型文件")
+    export_parser.add_argument("--backend", choices=BACKEND_OPTIONS[1:], default="onnx")
+    export_parser.add_argument("--imgsz", type=int, nargs="+", default=IMGSZ_OPTIONS, choices=IMGSZ_OPTIONS)
+    export_parser.set_defaults(func=_cmd_export)
+
+    bench_parser = subparsers.add_parser("benchmark", help="在合成多目标场景上分阶段测试检测流水线")
+    bench_parser.add_argument("--model", default="yolov8n.pt", help="模型文件")
+    bench_parser.add_argument("--backend", choices=BACKEND_OPTIONS, default="torch")
+    bench_parser.add_argument("--imgsz", type=int, nargs="+", default=IMGSZ_OPTIONS, choices=IMGSZ_OPTIONS)
+    bench_parser.add_argument("--resolutions", nargs="+", help="源分辨率，如 640x480 1920x1080")
+    bench_parser.add_argument("--iterations", type=int, default=20)
+    bench_parser.add_argument("--warmup", type=int, default=3)
+    bench_parser.add_argument("--output", help="报告 JSON 输出路径")
+    bench_parser.add_argument("--compare", help="与之前的报告 JSON 对比")
+    bench_parser.set_defaults(func=_cmd_benchmark)
+
+    presynth_parser = subparsers.add_parser("tts-presynth", help="预合成所有类别的播报语音到 TTS 缓存")
+    presynth_parser.add_argument("--voice", nargs="+", help="音色，默认为 config.yaml 中的当前音色")
+    presynth_parser.add_argument("--concurrency", type=int, default=4, help="并发合成数")
+    presynth_parser.set_defaults(func=_cmd_tts_presynth)
+
+    video_parser = subparsers.add_parser("video", help="离线处理视频文件 / 流，检测结果写入 JSONL 或 Parquet")
+    video_parser.add_argument("source", help="视频文件路径或 OpenCV 支持的流地址（rtsp:// 等）")
+    video_parser.add_argument("--output", required=True, help="输出文件，.parquet 结尾时写 Parquet")
+    video_parser.add_argument("--format", choices=["jsonl", "parquet"], help="输出格式，默认按扩展名判断")
+    video_parser.add_argument("--model", default="yolov8n.pt", help="模型文件")
+    video_parser.add_argument("--backend", choices=BACKEND_OPTIONS, default="torch")
+    video_parser.add_argument("--imgsz", type=int, choices=IMGSZ_OPTIONS)
+    video_parser.add_argument("--conf", type=float, default=0.25)
+    video_parser.add_argument("--iou", type=float)
+    video_parser.add_argument("--classes", help="类别白名单，如 person,car")
+    video_parser.add_argument("--roi", help="归一化 ROI：x1,y1,x2,y2")
+    video_parser.add_argument("--tile", action="store_true", help="切片推理（参数见 config.yaml 的 tiling 段）")
+    video_parser.add_argument("--stride", type=int, default=1, help="每隔几帧处理一帧")
+    video_parser.add_argument("--max-frames", type=int, default=0, help="最多处理的帧数，0 为不限")
+    video_parser.add_argument("--batch", type=int, default=8, help="每批推理的最大帧数")
+    video_parser.add_argument("--max-wait-ms", type=float, default=10)
+    video_parser.add_argument("--workers", type=int, default=0, help="推理工作进程数，0 为进程内执行")
+    video_parser.add_argument("--queue-size", type=int, default=32, help="解码队列长度（背压上限）")
+    video_parser.set_defaults(func=_cmd_video)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+import os
+import yaml
+
+_CONFIG_PATH = os.path.join(os.path.dirname(__file__), '..', 'config.yaml')
+
+_config = None
+
+
+def load_config() -> dict:
+    """（重新）读取 config.yaml"""
+    global _config
+    with open(_CONFIG_PATH, 'r', encoding='utf-8') as f:
+        _config = yaml.safe_load(f) or {}
+    return _config
+
+
+def get_section(name: str) -> dict:
+    """返回 config.yaml 中的一个配置段，首次调用时加载配置
+
+    返回的是共享的字典，运行时修改（如 POST /api/config）对所有模块可见；缺少的段返回空字典。
+    """
+    if _config is None:
+        load_config()
+    return _config.setdefault(name, {})
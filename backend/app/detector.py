@@ -1,14 +1,17 @@
 import cv2
 import numpy as np
-from ultralytics import YOLO
-import torch
 import time
 import logging
 
+from .preprocess import FramePreprocessor, LETTERBOX_COLOR
+from .tiling import merge_views
+from .backends import create_engine, export_model, nms_postprocess, to_input_tensor
+
 logger = logging.getLogger(__name__)
 
 
 DEFAULT_IMGSZ = 320
+DEFAULT_IOU = 0.4
 IMGSZ_OPTIONS = [128, 160, 192, 224, 256, 288, 320, 416, 512, 640]
 
 COCO_CLASSES_CN = {
@@ -31,17 +34,103 @@ COCO_CLASSES_CN = {
 }
 
 
+def parse_classes(value, names: list) -> list:
+    """解析类别白名单：class_id 或英文类别名，逗号分隔的字符串或列表；空值返回 None（不过滤）"""
+    if value is None:
+        return None
+    items = value.split(",") if isinstance(value, str) else list(value)
+    class_ids = set()
+    for item in items:
+        item = str(item).strip()
+        if not item:
+            continue
+        if item.isdigit() and int(item) < len(names):
+            class_ids.add(int(item))
+        elif item in names:
+            class_ids.add(names.index(item))
+        else:
+            raise ValueError(f"unknown class: {item}")
+    return sorted(class_ids) or None
+
+
+def parse_roi(value) -> tuple:
+    """解析 ROI：x1,y1,x2,y2 为相对整帧的归一化坐标（0~1），逗号分隔的字符串或列表；空值返回 None"""
+    if value is None or value == "":
+        return None
+    items = value.split(",") if isinstance(value, str) else list(value)
+    if len(items) != 4:
+        raise ValueError("roi must be x1,y1,x2,y2")
+    x1, y1, x2, y2 = (min(1.0, max(0.0, float(item))) for item in items)
+    if x2 <= x1 or y2 <= y1:
+        raise ValueError("roi must have x2 > x1 and y2 > y1")
+    if (x1, y1, x2, y2) == (0.0, 0.0, 1.0, 1.0):
+        return None
+    return x1, y1, x2, y2
+
+
 class YOLODetector:
-    def __init__(self, model_path: str = "yolov8n.pt"):
+    def __init__(self, model_path: str = "yolov8n.pt", backend: str = "torch",
+                 intra_op_threads: int = 0, inter_op_threads: int = 0):
+        # torch / ultralytics 导入需要数秒，创建检测器时才导入；
+        # 只用到本模块常量与解析函数的模块（main、websocket_handler 等）导入时不受影响
+        from ultralytics import YOLO
+
         self.model = YOLO(model_path)
         self.class_names = self.model.names
         self.avg_process_time = 0
         self.benchmark_done = False
+        # 最近一次 detect_batch 各阶段耗时（纳秒）
+        self.last_timings = {}
         self.imgsz = DEFAULT_IMGSZ
+
+        # 类别名称查找表，后处理时按 class_id 直接索引
+        num_classes = max(self.class_names) + 1
+        self.names_en = [self.class_names.get(i, str(i)) for i in range(num_classes)]
+        self.names_cn = [COCO_CLASSES_CN.get(i, self.names_en[i]) for i in range(num_classes)]
+
+        self.preprocessor = FramePreprocessor()
         
         self._detect_device()
-        
+
+        self.backend = "torch"
+        self.engine = None
+        if backend == "torch":
+            self._set_torch_threads(intra_op_threads, inter_op_threads)
+        else:
+            self._init_engine(model_path, backend, intra_op_threads, inter_op_threads)
+
+    @staticmethod
+    def _set_torch_threads(intra_op_threads: int, inter_op_threads: int):
+        import torch
+
+        try:
+            if intra_op_threads:
+                torch.set_num_threads(intra_op_threads)
+            if inter_op_threads:
+                torch.set_num_interop_threads(inter_op_threads)
+        except RuntimeError as e:
+            # 并行任务开始后无法再修改 inter-op 线程数
+            logger.warning(f"Failed to set torch threads: {e}")
+
+    def _init_engine(self, model_path: str, backend: str, intra_op_threads: int, inter_op_threads: int):
+        """导出（或从缓存加载）各 imgsz 的推理引擎，失败时回退到 PyTorch"""
+        ckpt_path = getattr(self.model, "ckpt_path", None) or model_path
+        try:
+            engine = create_engine(backend, intra_op_threads, inter_op_threads)
+            for imgsz in IMGSZ_OPTIONS:
+                engine.register(export_model(ckpt_path, backend, imgsz), imgsz)
+            # 其余尺寸在预热或首次使用时再加载
+            engine.ensure_loaded(self.imgsz)
+        except Exception as e:
+            logger.error(f"Failed to initialize {backend} backend, falling back to torch: {e}")
+            return
+        self.engine = engine
+        self.backend = backend
+        logger.info(f"Using {backend} inference backend")
+
     def _detect_device(self):
+        import torch
+
         if torch.cuda.is_available():
             self.device = 'cuda'
             self.half = True
@@ -50,46 +139,139 @@ class YOLODetector:
             self.half = False
         self.model.to(self.device)
         
-    def detect(self, image_data: bytes, conf: float = 0.25) -> dict:
-        # Input validation
-        if not image_data or len(image_data) == 0:
-            return {"detections": [], "width": 0, "height": 0}
-        
-        try:
-            nparr = np.frombuffer(image_data, np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            if image is None:
-                return {"detections": [], "width": 0, "height": 0}
-        except Exception:
-            return {"detections": [], "width": 0, "height": 0}
-        
-        h, w = image.shape[:2]
-
-        results = self.model(image, conf=conf, iou=0.4, verbose=False, imgsz=self.imgsz, half=self.half)
-
-        detections = []
-        for result in results:
-            boxes = result.boxes
-            for box in boxes:
-                x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                conf_score = float(box.conf[0])
-                class_id = int(box.cls[0])
-                class_name = self.class_names[class_id]
-                class_name_cn = COCO_CLASSES_CN.get(class_id, class_name)
-
-                detections.append({
-                    "bbox": [float(x1), float(y1), float(x2), float(y2)],
-                    "confidence": conf_score,
-                    "class_id": class_id,
-                    "class_name": class_name,
-                    "class_name_cn": class_name_cn
-                })
-
-        return {"detections": detections, "width": w, "height": h}
+    def detect(self, image_data: bytes, conf: float = 0.25, columnar: bool = False,
+               imgsz: int = None, iou: float = DEFAULT_IOU, classes: list = None, roi: tuple = None,
+               tile=None) -> dict:
+        return self.detect_batch([image_data], [conf], columnar, imgsz, iou, [classes], [roi], [tile])[0]
+
+    def detect_batch(self, images_data: list, confs: list, columnar: bool = False,
+                     imgsz: int = None, iou: float = DEFAULT_IOU,
+                     classes: list = None, rois: list = None, tiles: list = None) -> list:
+        """对多帧图片执行一次批量推理，按输入顺序返回每帧结果
+
+        columnar=True 时返回列式结果（boxes/scores/class_ids 平行数组），
+        否则返回逐个检测框的字典列表。imgsz 未指定时使用服务端默认值 self.imgsz。
+        classes / rois / tiles 与输入一一对应：每帧的类别白名单、归一化 ROI 与切片参数（TileSpec），
+        None 表示不限 / 不切片。切片的帧所有切片与其他帧在同一批次中推理，各切片的检测框
+        还原到整帧坐标后跨切片合并。检测框始终为整帧坐标。
+        """
+        outputs = [self._empty_result(columnar) for _ in images_data]
+        timings = {"decode": 0, "preprocess": 0, "inference": 0, "postprocess": 0}
+        self.last_timings = timings
+
+        imgsz = imgsz or self.imgsz
+        images, metas, indices = self.preprocessor.prepare_batch(images_data, imgsz, timings, rois, tiles)
+        if not images:
+            return outputs
+
+        # 一次批量推理使用最低阈值与各帧类别白名单的并集，再按各帧自己的设置过滤
+        min_conf = min(confs[i] for i in indices)
+        classes = classes or [None] * len(images_data)
+        wanted = [classes[i] for i in indices]
+        batch_classes = None if None in wanted else sorted(set().union(*wanted))
+        start = time.perf_counter_ns()
+        batch_data = self._infer(images, imgsz, min_conf, iou, batch_classes)
+        inferred_at = time.perf_counter_ns()
+        timings["inference"] = inferred_at - start
+
+        # 帧下标 -> (元信息, 各视图还原到整帧坐标的检测结果)；未切片的帧只有一个视图
+        frames = {}
+        for i, meta, data in zip(indices, metas, batch_data):
+            keep = data[:, 4] >= confs[i]
+            if classes[i] is not None and classes[i] != batch_classes:
+                keep &= np.isin(data[:, 5], classes[i])
+            data = data[keep]
+            data = np.column_stack([self.preprocessor.restore_boxes(data[:, :4], meta), data[:, 4:6]])
+            frames.setdefault(i, (meta, []))[1].append(data)
+
+        for i, (meta, views) in frames.items():
+            data = views[0]
+            if len(views) > 1:
+                view_ids = np.concatenate([np.full(len(view), v) for v, view in enumerate(views)])
+                data = merge_views(np.concatenate(views), view_ids, tiles[i].merge_threshold)
+            output = {
+                "boxes": data[:, :4].tolist(),
+                "scores": data[:, 4].astype(np.float32).tolist(),
+                "class_ids": data[:, 5].astype(np.int32).tolist(),
+                "width": meta.width,
+                "height": meta.height
+            }
+            outputs[i] = output if columnar else self.to_records(output)
+
+        timings["postprocess"] = time.perf_counter_ns() - inferred_at
+        return outputs
+
+    def _infer(self, images: list, imgsz: int, conf: float, iou: float = DEFAULT_IOU,
+               classes: list = None) -> list:
+        """对 letterbox 画布执行推理，返回每帧 (N, 6) 数组：x1, y1, x2, y2, conf, cls"""
+        if self.engine is not None:
+            pred = self.engine.infer(to_input_tensor(images), imgsz)
+            return nms_postprocess(pred, conf, iou, classes)
+        results = self.model(images, conf=conf, iou=iou, verbose=False, imgsz=imgsz, half=self.half,
+                             classes=classes)
+        # boxes.data 每行为 x1, y1, x2, y2, conf, cls，一次性拷贝到主机内存
+        return [result.boxes.data.cpu().numpy() for result in results]
+
+    def warmup(self, imgsz: int, batch_size: int = 1) -> dict:
+        """以空白画布执行推理，预热指定尺寸的推理路径（内存分配、算子选择、引擎加载）"""
+        import torch
+
+        before = torch.cuda.memory_reserved() if self.device == 'cuda' else 0
+        canvas = np.full((imgsz, imgsz, 3), LETTERBOX_COLOR, dtype=np.uint8)
+        start = time.perf_counter()
+        self._infer([canvas] * batch_size, imgsz, 0.25)
+        elapsed = time.perf_counter() - start
+
+        if self.engine is not None:
+            memory_bytes = self.engine.model_bytes(imgsz)
+        elif self.device == 'cuda':
+            memory_bytes = max(0, torch.cuda.memory_reserved() - before)
+        else:
+            memory_bytes = 0
+        return {"warmup_ms": round(elapsed * 1000, 2), "memory_bytes": memory_bytes}
+
+    @property
+    def releasable(self) -> bool:
+        """各 imgsz 是否占用可单独释放的资源
+
+        ONNX / OpenVINO 每个尺寸一个推理会话；PyTorch 模型与输入尺寸无关，release 不释放任何内存。
+        """
+        return self.engine is not None
+
+    def release(self, imgsz: int):
+        """释放指定尺寸占用的引擎资源"""
+        if self.engine is not None:
+            self.engine.unload(imgsz)
+
+    @staticmethod
+    def _empty_result(columnar: bool) -> dict:
+        if columnar:
+            return {"boxes": [], "scores": [], "class_ids": [], "width": 0, "height": 0}
+        return {"detections": [], "width": 0, "height": 0}
+
+    def to_records(self, result: dict) -> dict:
+        """将列式结果转换为逐个检测框的字典列表"""
+        names_en = self.names_en
+        names_cn = self.names_cn
+        detections = [
+            {
+                "bbox": bbox,
+                "confidence": score,
+                "class_id": class_id,
+                "class_name": names_en[class_id],
+                "class_name_cn": names_cn[class_id]
+            }
+            for bbox, score, class_id in zip(result["boxes"], result["scores"], result["class_ids"])
+        ]
+        if "track_ids" in result:
+            for detection, track_id in zip(detections, result["track_ids"]):
+                detection["track_id"] = track_id
+        return {"detections": detections, "width": result["width"], "height": result["height"]}
 
     def get_info(self) -> dict:
         return {
             "device": self.device,
+            "backend": self.backend,
             "model": "yolov8n",
             "imgsz": self.imgsz,
             "imgsz_options": IMGSZ_OPTIONS
@@ -110,9 +292,9 @@ class YOLODetector:
         
         times = []
         for _ in range(iterations):
-            start = time.time()
+            start = time.perf_counter()
             self.detect(test_data)
-            times.append(time.time() - start)
+            times.append(time.perf_counter() - start)
         
         avg_time = sum(times) / len(times)
         self.avg_process_time = avg_time
@@ -120,10 +302,11 @@ class YOLODetector:
         
         recommended_fps = max(1, int(1.0 / avg_time)) if avg_time > 0 else 1
         
-        logger.info(f"[Benchmark] avg_time={avg_time:.3f}s, recommended_fps={recommended_fps}")
+        logger.info(f"[Benchmark] backend={self.backend}, avg_time={avg_time:.3f}s, recommended_fps={recommended_fps}")
         
         return {
             "device": self.device,
+            "backend": self.backend,
             "avg_process_time_ms": round(avg_time * 1000, 2),
             "recommended_fps": recommended_fps,
             "iterations": iterations
@@ -5,20 +5,42 @@ os.environ["GLOG_minloglevel"] = "2"  # 0=DEBUG, 1=INFO, 2=WARNING, 3=ERROR
 import logging
 logging.getLogger("torch").setLevel(logging.ERROR)
 
-from fastapi import FastAPI, WebSocket, UploadFile, File
+from fastapi import FastAPI, WebSocket, UploadFile, File, HTTPException, Query, Depends
+from typing import List
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, JSONResponse
 from contextlib import asynccontextmanager
+import asyncio
 import base64
+import time
 from pydantic import BaseModel
 
-from .detector import YOLODetector
+from .detector import YOLODetector, IMGSZ_OPTIONS, parse_classes, parse_roi
+from .scheduler import InferenceScheduler
+from .worker_pool import DetectorProcessPool, resolve_worker_count
+from .warmup import WarmupManager, resolve_warmup_sizes
+from .benchmark import run_benchmark_async, parse_resolution
 from .websocket_handler import handle_websocket
+from .tts_presynth import get_presynthesizer, close_presynthesizer
+from .motion_gate import get_gate_stats
+from .tiling import TileSpec
+from .video_pipeline import VideoJobManager, resolve_format
+from . import metrics
+from .config import get_section
 from . import tts_handler
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 detector = None
+scheduler = None
+worker_pool = None
+warmup_manager = None
+video_jobs = None
+
+# 启动状态：starting -> loading_model -> [starting_workers] -> warming_up -> ready / failed
+startup = {"state": "starting", "error": None, "started_at": None, "ready_at": None, "elapsed_s": None}
+_started_at = 0.0
 
 
 class ConfigUpdate(BaseModel):
@@ -27,18 +49,123 @@ class ConfigUpdate(BaseModel):
     tts_voice: str = None
 
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    global detector
-    logger.info("Loading YOLOv8n model...")
+class WarmupRequest(BaseModel):
+    sizes: list = None
+
+
+class VideoJobRequest(BaseModel):
+    source: str
+    format: str = "jsonl"
+    conf: float = 0.25
+    imgsz: int = None
+    iou: float = None
+    classes: str = None
+    roi: str = None
+    tile: bool = False
+    stride: int = 1
+    max_frames: int = 0
+
+
+def _set_state(state: str, error: str = None):
+    startup["state"] = state
+    startup["error"] = error
+    if state == "ready":
+        startup["ready_at"] = time.time()
+        startup["elapsed_s"] = round(time.perf_counter() - _started_at, 2)
+    logger.info(f"[Startup] {state}" + (f": {error}" if error else ""))
+
+
+async def _load():
+    """后台加载模型、启动推理进程与调度器并预热，期间服务已可响应探针"""
     try:
-        detector = YOLODetector("yolov8n.pt")
-        logger.info("Model loaded successfully")
+        await _load_components()
     except Exception as e:
-        logger.error(f"Failed to load model: {e}")
-        detector = YOLODetector()
+        logger.error(f"Startup failed: {e}")
+        _set_state("failed", str(e))
+
+
+async def _load_components():
+    global detector, scheduler, worker_pool, warmup_manager, video_jobs
+    inference_config = get_section('inference')
+    detector_kwargs = {
+        "backend": inference_config.get('backend', 'torch'),
+        "intra_op_threads": inference_config.get('intra_op_threads', 0),
+        "inter_op_threads": inference_config.get('inter_op_threads', 0)
+    }
+
+    # 导入 torch、加载权重（可能需要下载）与导出引擎都在线程中进行，不阻塞事件循环
+    # 加载失败时不再以相同参数重建（必然再次失败），状态置为 failed，由编排系统重启
+    _set_state("loading_model")
+    detector = await asyncio.to_thread(YOLODetector, "yolov8n.pt", **detector_kwargs)
+
+    max_batch_size = inference_config.get('max_batch_size', 8)
+    num_workers = resolve_worker_count(inference_config.get('workers', 0))
+    if num_workers > 0:
+        _set_state("starting_workers")
+        logger.info(f"Starting {num_workers} inference worker processes...")
+        try:
+            worker_pool = await asyncio.to_thread(
+                DetectorProcessPool, detector, num_workers,
+                detector_kwargs=detector_kwargs, max_batch_size=max_batch_size
+            )
+        except Exception as e:
+            # 回退到进程内执行器
+            logger.error(f"Failed to start worker pool, falling back to in-process inference: {e}")
+            worker_pool = None
+
+    scheduler = InferenceScheduler(
+        detector,
+        max_batch_size=max_batch_size,
+        max_wait_ms=inference_config.get('max_wait_ms', 10),
+        pool=worker_pool
+    )
+    scheduler.start()
+    warmup_manager = WarmupManager(scheduler, budget_mb=inference_config.get('warmup_budget_mb', 512))
+    video_config = get_section('video')
+    video_jobs = VideoJobManager(
+        scheduler, video_config.get('output_dir', 'video_results'), video_config.get('input_dir', 'videos'),
+        allow_urls=video_config.get('allow_urls', False), queue_size=video_config.get('queue_size', 32)
+    )
+
+    # 预热各尺寸推理路径，避免切换 imgsz 后首帧卡顿；预热期间已可接受请求，但 /readyz 仍返回 503
+    _set_state("warming_up")
+    await warmup_manager.warmup_all(resolve_warmup_sizes(inference_config.get('warmup_sizes', 'all')))
+
+    tts_config = tts_handler.get_tts_config()
+    if tts_config.get('enabled', False):
+        await asyncio.to_thread(tts_handler.preload_sdk)
+    # 后台预合成当前音色的播报语音，不阻塞启动
+    if tts_config.get('presynth_on_startup', False):
+        get_presynthesizer().start(tts_handler.get_tts_voice())
+    _set_state("ready")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global detector, scheduler, worker_pool, warmup_manager, video_jobs, _started_at
+    _started_at = time.perf_counter()
+    startup.update(state="starting", error=None, started_at=time.time(), ready_at=None, elapsed_s=None)
+    # 模型在后台加载，端口立即开始监听
+    loader = asyncio.create_task(_load())
     yield
 
+    loader.cancel()
+    await asyncio.gather(loader, return_exceptions=True)
+    warmup_manager = None
+    await close_presynthesizer()
+    tts_handler.close_tts_pool()
+
+    # 先取消视频任务，它们的推理仍在调度器中
+    if video_jobs is not None:
+        await video_jobs.close()
+        video_jobs = None
+    if scheduler is not None:
+        await scheduler.stop()
+        scheduler = None
+    if worker_pool is not None:
+        worker_pool.shutdown()
+        worker_pool = None
+
     # Cleanup: unload model and release resources
     try:
         if detector is not None:
@@ -51,6 +178,12 @@ async def lifespan(app: FastAPI):
     gc.collect()
 
 
+def require_ready():
+    """推理组件尚未就绪时返回 503（模型仍在加载或加载失败）"""
+    if scheduler is None:
+        raise HTTPException(status_code=503, detail=f"service not ready: {startup['state']}")
+
+
 app = FastAPI(title="YOLO Vision API", lifespan=lifespan)
 
 app.add_middleware(
@@ -67,23 +200,60 @@ async def root():
     return {"message": "YOLO Vision API", "status": "running"}
 
 
-@app.get("/api/classes")
+@app.get("/healthz")
+async def healthz():
+    # 存活探针：进程能响应即为存活；模型加载失败时返回 503，由编排系统重启
+    failed = startup["state"] == "failed"
+    return JSONResponse(status_code=503 if failed else 200, content={"status": "failed" if failed else "ok", **startup})
+
+
+@app.get("/readyz")
+async def readyz():
+    # 就绪探针：模型加载并预热完成后才接收流量
+    status_code = 200 if startup["state"] == "ready" else 503
+    return JSONResponse(status_code=status_code, content=startup)
+
+
+@app.get("/api/classes", dependencies=[Depends(require_ready)])
 async def get_classes():
     return {"classes": detector.get_classes()}
 
 
-@app.get("/api/info")
+@app.get("/api/info", dependencies=[Depends(require_ready)])
 async def get_info():
-    return detector.get_info()
+    info = detector.get_info()
+    info["scheduler"] = scheduler.get_stats()
+    info["warmup"] = warmup_manager.get_status()
+    info["motion_gate"] = get_gate_stats()
+    return info
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
 
 
-@app.get("/api/benchmark")
-async def get_benchmark():
-    result = detector.benchmark(iterations=5)
-    return result
+@app.get("/api/benchmark", dependencies=[Depends(require_ready)])
+async def get_benchmark(suite: bool = False, imgsz: List[int] = Query(None),
+                        resolutions: List[str] = Query(None), iterations: int = 20):
+    # 在推理执行器中运行，避免阻塞事件循环及与实时推理并发使用模型
+    if not suite:
+        return await scheduler.run_exclusive(detector.benchmark, None, 5)
+
+    # 完整基准：合成多目标场景 × imgsz × 源分辨率，分阶段统计 p50/p95/p99
+    try:
+        parsed = [parse_resolution(r) for r in resolutions] if resolutions else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="resolutions must look like 1280x720")
+    sizes = [s for s in imgsz if s in IMGSZ_OPTIONS] if imgsz else IMGSZ_OPTIONS
+    if not sizes:
+        raise HTTPException(status_code=400, detail=f"imgsz must be one of {IMGSZ_OPTIONS}")
+
+    # 每次检测单独提交到推理执行器，期间实时连接的批次可以穿插执行
+    return await run_benchmark_async(scheduler.run_exclusive, detector, sizes, parsed, iterations)
 
 
-@app.get("/api/config")
+@app.get("/api/config", dependencies=[Depends(require_ready)])
 async def get_config():
     tts_config = tts_handler.get_tts_config()
     return {
@@ -94,27 +264,133 @@ async def get_config():
     }
 
 
-@app.post("/api/config")
+@app.post("/api/config", dependencies=[Depends(require_ready)])
 async def update_config(config: ConfigUpdate):
     if config.tts_enabled is not None:
+        if config.tts_enabled:
+            await asyncio.to_thread(tts_handler.preload_sdk)
         tts_handler.set_tts_enabled(config.tts_enabled)
     if config.tts_voice is not None:
         tts_handler.set_tts_voice(config.tts_voice)
-    if config.imgsz is not None:
+    if config.imgsz is not None and config.imgsz in IMGSZ_OPTIONS:
+        # 先预热新尺寸再切换，切换后的首帧不会卡顿
+        await warmup_manager.warmup(config.imgsz)
         detector.set_imgsz(config.imgsz)
+        warmup_manager.touch(config.imgsz)
     return {"success": True}
 
 
+@app.post("/api/warmup", dependencies=[Depends(require_ready)])
+async def warmup(request: WarmupRequest = None):
+    sizes = resolve_warmup_sizes(request.sizes if request is not None else None)
+    await warmup_manager.warmup_all(sizes)
+    return warmup_manager.get_status()
+
+
 @app.websocket("/ws/detect")
 async def websocket_endpoint(websocket: WebSocket):
-    await handle_websocket(websocket, detector)
+    if scheduler is None:
+        # 先完成握手再以 1013 (Try Again Later) 关闭，客户端能拿到关闭码与原因
+        await websocket.accept()
+        await websocket.close(code=1013, reason=f"service not ready: {startup['state']}")
+        return
+    await handle_websocket(websocket, scheduler)
+
+
+@app.post("/api/detect", dependencies=[Depends(require_ready)])
+async def detect_image(file: UploadFile = File(None), files: List[UploadFile] = File(None),
+                       conf: float = 0.25, imgsz: int = None, iou: float = None,
+                       classes: str = None, roi: str = None, tile: bool = False):
+    if imgsz is not None and imgsz not in IMGSZ_OPTIONS:
+        raise HTTPException(status_code=400, detail=f"imgsz must be one of {IMGSZ_OPTIONS}")
+    if iou is not None and not 0 < iou < 1:
+        raise HTTPException(status_code=400, detail="iou must be between 0 and 1")
+    try:
+        classes = parse_classes(classes, detector.names_en)
+        roi = parse_roi(roi)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    tile = TileSpec.from_config(get_section('tiling')) if tile else None
+
+    if file is not None and not files:
+        contents = await file.read()
+        result = await scheduler.submit(contents, conf, imgsz=imgsz, iou=iou,
+                                        classes=classes, roi=roi, tile=tile)
+        return {"detections": result["detections"]}
+
+    uploads = ([file] if file is not None else []) + (files or [])
+    if not uploads:
+        raise HTTPException(status_code=400, detail="no file uploaded")
+
+    # 多文件批量检测：同一请求最多同时占用一个批次的队列位置，不会挤占实时连接
+    limit = asyncio.Semaphore(scheduler.max_batch_size)
+
+    async def detect_one(upload: UploadFile) -> dict:
+        async with limit:
+            contents = await upload.read()
+            result = await scheduler.submit(contents, conf, imgsz=imgsz, iou=iou,
+                                            classes=classes, roi=roi, tile=tile)
+        return {
+            "filename": upload.filename,
+            "detections": result["detections"],
+            "width": result["width"],
+            "height": result["height"]
+        }
+
+    return {"results": await asyncio.gather(*(detect_one(upload) for upload in uploads))}
+
+
+# 离线视频处理 API
+@app.post("/api/video/jobs", dependencies=[Depends(require_ready)])
+async def create_video_job(request: VideoJobRequest):
+    if not 0 <= request.conf <= 1:
+        raise HTTPException(status_code=400, detail="conf must be between 0 and 1")
+    if request.stride < 1:
+        raise HTTPException(status_code=400, detail="stride must be at least 1")
+    if request.max_frames < 0:
+        raise HTTPException(status_code=400, detail="max_frames must be 0 (no limit) or positive")
+    if request.imgsz is not None and request.imgsz not in IMGSZ_OPTIONS:
+        raise HTTPException(status_code=400, detail=f"imgsz must be one of {IMGSZ_OPTIONS}")
+    if request.iou is not None and not 0 < request.iou < 1:
+        raise HTTPException(status_code=400, detail="iou must be between 0 and 1")
+    try:
+        fmt = resolve_format("", request.format)
+        classes = parse_classes(request.classes, detector.names_en)
+        roi = parse_roi(request.roi)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # 流地址由解码线程打开，失败时任务状态为 failed
+    try:
+        source = video_jobs.resolve_source(request.source)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    tile = TileSpec.from_config(get_section('tiling')) if request.tile else None
+
+    return video_jobs.start(
+        source, fmt, conf=request.conf, imgsz=request.imgsz, iou=request.iou,
+        classes=classes, roi=roi, tile=tile, stride=request.stride, max_frames=request.max_frames
+    )
+
+
+@app.get("/api/video/jobs", dependencies=[Depends(require_ready)])
+async def list_video_jobs():
+    return {"jobs": video_jobs.get_status()}
+
 
+@app.get("/api/video/jobs/{job_id}", dependencies=[Depends(require_ready)])
+async def get_video_job(job_id: str):
+    job = video_jobs.get_status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return job
 
-@app.post("/api/detect")
-async def detect_image(file: UploadFile = File(...)):
-    contents = await file.read()
-    result = detector.detect(contents)
-    return {"detections": result["detections"]}
+
+@app.delete("/api/video/jobs/{job_id}", dependencies=[Depends(require_ready)])
+async def cancel_video_job(job_id: str):
+    job = video_jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return job
 
 
 # TTS 缓存管理 API
@@ -129,6 +405,16 @@ async def clear_cache(voice: str = None):
     return {"success": True}
 
 
+@app.post("/api/tts/presynthesize")
+async def presynthesize(voice: str = None):
+    return get_presynthesizer().start(voice or tts_handler.get_tts_voice())
+
+
+@app.get("/api/tts/presynthesize")
+async def presynthesize_status(voice: str = None):
+    return get_presynthesizer().get_status(voice)
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
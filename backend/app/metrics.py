@@ -0,0 +1,282 @@
+"""进程内指标注册表，以 Prometheus 文本格式从 GET /metrics 导出
+
+指标位于每帧的热路径上，因此：
+- 带标签的指标在模块加载时预先绑定子指标（labels() 的结果保存为模块变量），调用时不查字典；
+- 直方图的桶边界为元组，observe 只做一次二分查找和两次加法，不分配对象；
+- 队列深度、连接数等现成的状态不逐次上报，而是注册回调，在抓取时读取。
+多进程推理时各阶段耗时由工作进程随结果带回，在主进程中记录。
+"""
+import threading
+from bisect import bisect_left
+
+# 秒级耗时的默认桶：覆盖 1ms ~ 10s
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeChild:
+    __slots__ = ("value", "function")
+
+    def __init__(self):
+        self.value = 0
+        self.function = None
+
+    def set(self, value: float):
+        self.value = value
+
+    def set_function(self, function):
+        """抓取时调用 function() 取值，适合已有状态（队列长度、连接数）"""
+        self.function = function
+
+    def get(self) -> float:
+        if self.function is None:
+            return self.value
+        try:
+            return self.function()
+        except Exception:
+            return 0
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "_lock")
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        # 最后一个计数对应 +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """返回（并缓存）一组标签值对应的子指标，热路径上应在模块加载时预先绑定"""
+        values = tuple(str(value) for value in values)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def collect(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in list(self._children.items()):
+            lines.extend(self._sample_lines(values, child))
+        return lines
+
+    def _sample_lines(self, values: tuple, child) -> list:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1):
+        self._default.inc(amount)
+
+    @property
+    def value(self) -> float:
+        return self._default.value
+
+    def _sample_lines(self, values, child):
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self._default.set(value)
+
+    def set_function(self, function):
+        self._default.set_function(function)
+
+    def _sample_lines(self, values, child):
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.get())}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (),
+                 buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def _sample_lines(self, values, child):
+        with child._lock:
+            counts = list(child.counts)
+            total = child.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, values, f'le="{_format_value(float(bound))}"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Prometheus 文本格式的 Content-Type
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+# ---- 推理 ----
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "yolo_stage_seconds", "Per-batch detector stage latency", ("stage",)
+))
+# 与 YOLODetector.last_timings 的键一致，值为纳秒
+_STAGES = tuple(
+    (stage, STAGE_SECONDS.labels(stage))
+    for stage in ("decode", "preprocess", "inference", "postprocess")
+)
+
+BATCH_SECONDS = REGISTRY.register(Histogram(
+    "yolo_batch_seconds", "Scheduler batch latency including executor dispatch"
+))
+BATCH_SIZE = REGISTRY.register(Histogram(
+    "yolo_batch_size", "Frames per inference batch", buckets=(1, 2, 4, 8, 16, 32)
+))
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "yolo_queue_depth", "Frames waiting for inference in the scheduler"
+))
+WORKER_RESTARTS = REGISTRY.register(Counter(
+    "yolo_worker_restarts_total", "Inference worker processes that exited and were restarted"
+))
+
+
+def observe_stages(timings: dict):
+    """记录一次 detect_batch 的各阶段耗时（YOLODetector.last_timings，纳秒）"""
+    for stage, child in _STAGES:
+        child.observe(timings.get(stage, 0) / 1e9)
+
+
+# ---- WebSocket ----
+
+ACTIVE_CONNECTIONS = REGISTRY.register(Gauge(
+    "yolo_active_connections", "Open /ws/detect connections"
+))
+FRAMES = REGISTRY.register(Counter(
+    "yolo_frames_total", "Frames received on /ws/detect by outcome", ("outcome",)
+))
+FRAMES_PROCESSED = FRAMES.labels("processed")
+# 尚未处理即被更新的帧覆盖（latest-wins 槽位）
+FRAMES_DROPPED = FRAMES.labels("dropped")
+FRAMES_FAILED = FRAMES.labels("failed")
+# 格式错误、未进入处理的帧
+FRAMES_MALFORMED = FRAMES.labels("malformed")
+INFERENCE_SKIPPED = REGISTRY.register(Counter(
+    "yolo_inference_skipped_total", "Frames answered without inference", ("reason",)
+))
+SKIPPED_GATE = INFERENCE_SKIPPED.labels("motion_gate")
+SKIPPED_PREDICT = INFERENCE_SKIPPED.labels("track_predict")
+GATE_FRAMES = REGISTRY.register(Counter(
+    "yolo_motion_gate_frames_total", "Frames evaluated by the motion gate"
+))
+FRAME_WAIT_SECONDS = REGISTRY.register(Histogram(
+    "yolo_frame_wait_seconds", "Time a frame waited in the latest-wins slot"
+))
+FRAME_SECONDS = REGISTRY.register(Histogram(
+    "yolo_frame_seconds", "Server-side frame latency from receive to result sent"
+))
+SEND_SECONDS = REGISTRY.register(Histogram(
+    "yolo_send_seconds", "Time to send one detection result"
+))
+
+# ---- TTS ----
+
+TTS_CACHE = REGISTRY.register(Counter(
+    "tts_cache_requests_total", "TTS audio cache lookups", ("result",)
+))
+TTS_CACHE_HIT = TTS_CACHE.labels("hit")
+TTS_CACHE_MISS = TTS_CACHE.labels("miss")
+TTS_SYNTHESIS_SECONDS = REGISTRY.register(Histogram(
+    "tts_synthesis_seconds", "TTS synthesis latency (cache misses only)", ("mode",)
+))
+TTS_SYNTHESIS_POOLED = TTS_SYNTHESIS_SECONDS.labels("pooled")
+TTS_SYNTHESIS_BLOCKING = TTS_SYNTHESIS_SECONDS.labels("blocking")
+TTS_SYNTHESIS_ERRORS = REGISTRY.register(Counter(
+    "tts_synthesis_errors_total", "Failed TTS syntheses"
+))
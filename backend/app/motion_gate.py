@@ -0,0 +1,80 @@
+import cv2
+import numpy as np
+
+from . import metrics
+
+# 比较用缩略图宽度，高度按原图比例
+THUMB_WIDTH = 64
+
+
+def get_gate_stats() -> dict:
+    """所有连接累计的门控帧数与跳过推理的帧数（取自 /metrics 的计数器）"""
+    frames, skipped = int(metrics.GATE_FRAMES.value), int(metrics.SKIPPED_GATE.value)
+    return {
+        "frames": frames,
+        "skipped": skipped,
+        "skip_ratio": round(skipped / frames, 3) if frames else 0.0
+    }
+
+
+def _thumbnail(image_data: bytes) -> np.ndarray:
+    # JPEG 在 DCT 域按 1/8 解码灰度图，只需完整解码的一小部分开销
+    gray = cv2.imdecode(np.frombuffer(image_data, dtype=np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if gray is None:
+        return None
+    height = max(1, round(gray.shape[0] * THUMB_WIDTH / gray.shape[1]))
+    return cv2.resize(gray, (THUMB_WIDTH, height), interpolation=cv2.INTER_AREA)
+
+
+class MotionGate:
+    """单连接的画面变化门控
+
+    将每帧按 1/8 灰度解码并缩成小缩略图，与上一次实际推理的帧比较：像素差超过
+    pixel_threshold 的比例低于 changed_ratio 时认为画面未变化，复用上一次的检测结果。
+    与参考帧比较（而非与上一帧比较），缓慢的累积变化最终也会触发推理；
+    距上次推理超过 refresh_interval 秒时强制推理一次。
+    """
+
+    def __init__(self, pixel_threshold: int = 25, changed_ratio: float = 0.01, refresh_interval: float = 2.0):
+        self.pixel_threshold = pixel_threshold
+        self.changed_ratio = changed_ratio
+        self.refresh_interval = refresh_interval
+        self.frames = 0
+        self.skipped = 0
+        self._reference = None
+        self._candidate = None
+        self._refreshed_at = 0.0
+
+    def should_skip(self, image_data: bytes, now: float, reusable: bool = True) -> bool:
+        """画面相对参考帧未变化时返回 True（调用方复用上次结果）
+
+        reusable 为 False 表示调用方没有可复用的结果，本帧必然推理，只生成缩略图。
+        """
+        self.frames += 1
+        thumb = _thumbnail(image_data)
+        skip = (
+            reusable
+            and thumb is not None
+            and self._reference is not None
+            and thumb.shape == self._reference.shape
+            and now - self._refreshed_at < self.refresh_interval
+            and self._changed(thumb) < self.changed_ratio
+        )
+        if skip:
+            self.skipped += 1
+        else:
+            # 推理成功后才更新参考帧，见 commit()
+            self._candidate = thumb
+        return skip
+
+    def commit(self, now: float):
+        """本帧已完成推理，将其设为新的参考帧"""
+        self._reference = self._candidate
+        self._refreshed_at = now
+
+    def _changed(self, thumb: np.ndarray) -> float:
+        diff = cv2.absdiff(thumb, self._reference)
+        return np.count_nonzero(diff > self.pixel_threshold) / diff.size
+
+    def get_stats(self) -> dict:
+        return {"frames": self.frames, "skipped": self.skipped}
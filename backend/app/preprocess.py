@@ -0,0 +1,189 @@
+import math
+import time
+import cv2
+import numpy as np
+from typing import NamedTuple
+
+from .tiling import TileSpec, tile_side, tile_views
+
+# 与 Ultralytics LetterBox 一致的填充色
+LETTERBOX_COLOR = 114
+
+# JPEG 缩小解码档位（DCT 域缩放），从大到小尝试
+_REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+# 携带图像尺寸的 SOF 段标记（排除 DHT/JPG/DAC）
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+class FrameMeta(NamedTuple):
+    """letterbox 画布与原图之间的坐标映射"""
+    width: int
+    height: int
+    left: int
+    top: int
+    scale_x: float
+    scale_y: float
+    # 只推理 ROI 时 ROI 左上角在原图中的坐标
+    offset_x: float = 0.0
+    offset_y: float = 0.0
+
+
+def jpeg_size(data) -> tuple:
+    """从 JPEG SOF 段读取原图 (宽, 高)，无需解码；非 JPEG 返回 None"""
+    n = len(data)
+    if n < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    i = 2
+    while i + 9 < n:
+        if data[i] != 0xFF:
+            i += 1
+            continue
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            i += 2
+            continue
+        if marker in _SOF_MARKERS:
+            height = (data[i + 5] << 8) | data[i + 6]
+            width = (data[i + 7] << 8) | data[i + 8]
+            return width, height
+        i += 2 + ((data[i + 2] << 8) | data[i + 3])
+    return None
+
+
+class FramePreprocessor:
+    """解码与预处理阶段
+
+    根据原图尺寸与目标 imgsz 选择 JPEG 缩小解码档位，只做一次 letterbox
+    到复用的预分配画布上，并记录把检测框映射回原图坐标所需的参数。
+    """
+
+    def __init__(self):
+        # imgsz -> 画布列表，批次中每帧一块
+        self._buffers = {}
+
+    def _get_buffers(self, imgsz: int, count: int) -> list:
+        buffers = self._buffers.setdefault(imgsz, [])
+        while len(buffers) < count:
+            buffers.append(np.empty((imgsz, imgsz, 3), dtype=np.uint8))
+        return buffers
+
+    @staticmethod
+    def _decode(image_data, imgsz: int, roi: tuple = None, tile: TileSpec = None):
+        """解码图片，返回 (图像, 原图宽, 原图高)
+
+        给出 roi / tile 时按 ROI 区域或单个切片的尺寸选择缩小档位。
+        已解码的 BGR 数组（如视频帧）直接返回。
+        """
+        if isinstance(image_data, np.ndarray):
+            return image_data, image_data.shape[1], image_data.shape[0]
+        nparr = np.frombuffer(image_data, np.uint8)
+        size = jpeg_size(image_data)
+        if size is not None:
+            width, height = size
+            if tile is not None:
+                view = tile_side(width, height, roi, tile)
+            elif roi is not None:
+                view = max(width * (roi[2] - roi[0]), height * (roi[3] - roi[1]))
+            else:
+                view = max(width, height)
+            for factor, flag in _REDUCED_FLAGS:
+                # 缩小后（ROI / 切片的）长边仍不小于 imgsz 才使用该档位，避免损失精度
+                if view // factor >= imgsz:
+                    image = cv2.imdecode(nparr, flag)
+                    if image is None:
+                        return None, 0, 0
+                    # EXIF 旋转会交换宽高
+                    if (image.shape[1] > image.shape[0]) != (width > height) and width != height:
+                        width, height = height, width
+                    return image, width, height
+
+        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        if image is None:
+            return None, 0, 0
+        return image, image.shape[1], image.shape[0]
+
+    def prepare_batch(self, images_data: list, imgsz: int, timings: dict = None, rois: list = None,
+                      tiles: list = None) -> tuple:
+        """解码并 letterbox 一批图片（编码后的图片字节，或已解码的 BGR 数组）
+
+        返回 (画布列表, 元信息列表, 每块画布对应的输入下标)，解码失败的帧被跳过。
+        画布在下一次调用时会被复用，调用方需在此之前用完。
+        传入 timings 时累加 decode / preprocess 两个阶段的耗时（纳秒）。
+        rois 与输入一一对应，元素为归一化的 (x1, y1, x2, y2) 或 None，只将该区域 letterbox 到画布。
+        tiles 与输入一一对应，元素为 TileSpec 时该帧只解码一次，切成多块画布（下标重复出现）。
+        """
+        start = time.perf_counter_ns()
+        decoded = []
+        for i, image_data in enumerate(images_data):
+            if image_data is None or len(image_data) == 0:
+                continue
+            roi = rois[i] if rois else None
+            tile = tiles[i] if tiles else None
+            try:
+                image, width, height = self._decode(image_data, imgsz, roi, tile)
+            except Exception:
+                continue
+            if image is None:
+                continue
+            views = tile_views(width, height, roi, tile) if tile is not None else [roi]
+            for view in views:
+                decoded.append((i, image, width, height, view))
+
+        decoded_at = time.perf_counter_ns()
+
+        buffers = self._get_buffers(imgsz, len(decoded))
+        canvases = []
+        metas = []
+        indices = []
+        for (i, image, width, height, roi), canvas in zip(decoded, buffers):
+            image, crop = self._crop(image, width, height, roi)
+            offset_x, offset_y, crop_w, crop_h = crop
+            h, w = image.shape[:2]
+            ratio = min(imgsz / h, imgsz / w)
+            new_w = max(1, min(imgsz, int(round(w * ratio))))
+            new_h = max(1, min(imgsz, int(round(h * ratio))))
+            left = (imgsz - new_w) // 2
+            top = (imgsz - new_h) // 2
+
+            canvas.fill(LETTERBOX_COLOR)
+            canvas[top:top + new_h, left:left + new_w] = cv2.resize(
+                image, (new_w, new_h), interpolation=cv2.INTER_LINEAR
+            )
+
+            canvases.append(canvas)
+            metas.append(FrameMeta(width, height, left, top, new_w / crop_w, new_h / crop_h, offset_x, offset_y))
+            indices.append(i)
+
+        if timings is not None:
+            timings["decode"] = timings.get("decode", 0) + decoded_at - start
+            timings["preprocess"] = timings.get("preprocess", 0) + time.perf_counter_ns() - decoded_at
+        return canvases, metas, indices
+
+    @staticmethod
+    def _crop(image: np.ndarray, width: int, height: int, roi: tuple) -> tuple:
+        """按归一化 roi 裁剪解码后的图像（可能已缩小），返回 (裁剪图, ROI 在原图中的 (x, y, 宽, 高))"""
+        if roi is None:
+            return image, (0.0, 0.0, width, height)
+        h, w = image.shape[:2]
+        x1 = min(w - 1, int(roi[0] * w))
+        y1 = min(h - 1, int(roi[1] * h))
+        x2 = max(x1 + 1, min(w, math.ceil(roi[2] * w)))
+        y2 = max(y1 + 1, min(h, math.ceil(roi[3] * h)))
+        sx, sy = width / w, height / h
+        return image[y1:y2, x1:x2], (x1 * sx, y1 * sy, (x2 - x1) * sx, (y2 - y1) * sy)
+
+    @staticmethod
+    def restore_boxes(boxes: np.ndarray, meta: FrameMeta) -> np.ndarray:
+        """将画布坐标 (N, 4) 的检测框映射回原图坐标"""
+        boxes = boxes.astype(np.float32, copy=True)
+        boxes[:, [0, 2]] = np.clip((boxes[:, [0, 2]] - meta.left) / meta.scale_x + meta.offset_x, 0, meta.width)
+        boxes[:, [1, 3]] = np.clip((boxes[:, [1, 3]] - meta.top) / meta.scale_y + meta.offset_y, 0, meta.height)
+        return boxes
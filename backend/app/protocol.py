@@ -0,0 +1,76 @@
+import struct
+import numpy as np
+
+# 客户端 -> 服务端消息类型
+MSG_FRAME = 0x01
+# 带序号的帧，服务端在结果中回传序号与时间信息
+MSG_FRAME_SEQ = 0x05
+
+# 服务端 -> 客户端二进制消息类型
+MSG_RESULT = 0x02
+MSG_TTS_AUDIO = 0x03
+# 开启跟踪时的检测结果，每个检测框多一个 track_id
+MSG_TRACKED_RESULT = 0x04
+
+# 带序号的帧头：消息类型, 置信度百分比, 帧序号 (uint32), 客户端时间戳 (float64, 毫秒)，其后为 JPEG
+FRAME_SEQ_HEADER = struct.Struct('<BBId')
+
+# 检测结果头：消息类型, 帧号, 宽, 高, 检测框数量
+RESULT_HEADER = struct.Struct('<BIHHH')
+
+# 单个检测框：x1, y1, x2, y2, 置信度 (float32) + class_id (uint16)，共 22 字节
+RESULT_RECORD = np.dtype([('bbox', '<f4', (4,)), ('score', '<f4'), ('class_id', '<u2')])
+
+# 跟踪结果中的单个检测框：在 RESULT_RECORD 后追加 track_id (uint32)，共 26 字节，0 表示未跟踪
+TRACKED_RECORD = np.dtype([('bbox', '<f4', (4,)), ('score', '<f4'), ('class_id', '<u2'), ('track_id', '<u4')])
+
+# 结果时间信息，带序号的帧的结果在检测框之后追加：客户端时间戳（原样回传）、服务端收到帧的时间
+# (float64, Unix 毫秒)、帧在槽位中的等待时长与服务端总耗时 (float32, 毫秒)
+RESULT_TIMING = struct.Struct('<ddff')
+
+# TTS 音频分片头：消息类型, 语音流 id，其后为 tts_start 中 codec 指定格式的音频（pcm / adpcm 块）
+TTS_AUDIO_HEADER = struct.Struct('<BI')
+
+
+def unpack_frame(message: bytes) -> tuple:
+    """解析帧消息，返回 (帧序号, 置信度, 客户端时间戳, JPEG 数据)
+
+    MSG_FRAME 不带序号与时间戳，对应位置返回 None。MSG_FRAME_SEQ 缺少头部或图片数据时抛出 ValueError，
+    不按旧格式解析（否则头部字节会被当作 JPEG 数据）。
+    """
+    if message[0] == MSG_FRAME_SEQ:
+        if len(message) <= FRAME_SEQ_HEADER.size:
+            raise ValueError(f"sequenced frame too short: {len(message)} bytes")
+        _, conf_int, seq, client_ts = FRAME_SEQ_HEADER.unpack_from(message)
+        return seq, conf_int / 100.0, client_ts, message[FRAME_SEQ_HEADER.size:]
+    conf_int = message[1] if len(message) > 1 else 25
+    return None, conf_int / 100.0, None, message[2:] if len(message) > 2 else message[1:]
+
+
+def pack_result(frame_id: int, result: dict, timing: tuple = None) -> bytes:
+    """将列式检测结果打包为二进制消息，类别名称在连接时通过 classes 消息下发
+
+    结果带 track_ids 时使用 MSG_TRACKED_RESULT 格式；timing 为 RESULT_TIMING 的四个字段，
+    给出时追加在检测框之后。
+    """
+    count = len(result["class_ids"])
+    tracked = "track_ids" in result
+    header = RESULT_HEADER.pack(
+        MSG_TRACKED_RESULT if tracked else MSG_RESULT,
+        frame_id & 0xFFFFFFFF, result["width"], result["height"], count
+    )
+    records = np.empty(count, dtype=TRACKED_RECORD if tracked else RESULT_RECORD)
+    if count:
+        records['bbox'] = result["boxes"]
+        records['score'] = result["scores"]
+        records['class_id'] = result["class_ids"]
+        if tracked:
+            records['track_id'] = result["track_ids"]
+    if timing is None:
+        return header + records.tobytes()
+    return header + records.tobytes() + RESULT_TIMING.pack(*timing)
+
+
+def pack_tts_audio(stream_id: int, pcm: bytes) -> bytes:
+    """将一个 TTS 音频分片打包为二进制消息，开始 / 结束通过 tts_start / tts_end 文本消息通知"""
+    return TTS_AUDIO_HEADER.pack(MSG_TTS_AUDIO, stream_id & 0xFFFFFFFF) + pcm
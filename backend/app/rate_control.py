@@ -0,0 +1,93 @@
+import time
+
+from .detector import IMGSZ_OPTIONS
+
+# 按容量估算帧率时保留的余量，避免把推理跑满
+HEADROOM = 0.8
+# 连续多少次有余量后才提升分辨率，避免来回抖动
+RECOVER_ROUNDS = 3
+
+
+class Ewma:
+    """指数加权移动平均"""
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self.value = None
+
+    def update(self, sample: float) -> float:
+        if self.value is None:
+            self.value = sample
+        else:
+            self.value += self.alpha * (sample - self.value)
+        return self.value
+
+
+class RateController:
+    """单连接的帧率 / 分辨率反馈控制
+
+    根据调度器的全局吞吐估计、队列深度与本连接的端到端延迟，计算客户端应使用的
+    发送帧率与 imgsz：负载高时先降帧率、降到 downscale_fps 以下再降分辨率，
+    空闲时逐级恢复，结果通过 {"type": "rate"} 消息下发。
+    """
+
+    def __init__(self, scheduler, max_fps: int = 15, min_fps: int = 1, downscale_fps: int = 5,
+                 min_imgsz: int = 160, interval: float = 1.0):
+        self.scheduler = scheduler
+        self.max_fps = max_fps
+        self.min_fps = min_fps
+        self.downscale_fps = downscale_fps
+        self.min_imgsz = min_imgsz
+        self.interval = interval
+
+        self.latency = Ewma()
+        self.fps = None
+        self.imgsz = None
+        self._last_update = 0.0
+        self._recover_rounds = 0
+
+    def update(self, latency: float, ceiling_imgsz: int, active_connections: int) -> dict:
+        """记录一帧的端到端延迟，需要调整时返回 rate 消息，否则返回 None"""
+        self.latency.update(latency)
+        now = time.monotonic()
+        if self.fps is not None and now - self._last_update < self.interval:
+            return None
+        self._last_update = now
+
+        # 全局吞吐按连接数均分；本连接每次只处理一帧，帧率也不可能超过 1 / 延迟
+        share = self.scheduler.estimate_capacity_fps() / max(1, active_connections)
+        fps = share * HEADROOM
+        if self.latency.value:
+            fps = min(fps, 1.0 / self.latency.value)
+        backlog = self.scheduler.is_backlogged()
+        if backlog:
+            fps /= 2
+        fps = int(max(self.min_fps, min(self.max_fps, fps)))
+
+        imgsz = min(self.imgsz or ceiling_imgsz, ceiling_imgsz)
+        if fps < self.downscale_fps and (backlog or fps <= self.min_fps):
+            imgsz = self._step(imgsz, -1, ceiling_imgsz)
+            self._recover_rounds = 0
+        elif fps >= self.max_fps and not backlog:
+            self._recover_rounds += 1
+            if self._recover_rounds >= RECOVER_ROUNDS:
+                imgsz = self._step(imgsz, 1, ceiling_imgsz)
+                self._recover_rounds = 0
+        else:
+            self._recover_rounds = 0
+
+        if fps == self.fps and imgsz == self.imgsz:
+            return None
+        self.fps = fps
+        self.imgsz = imgsz
+        return {"type": "rate", "fps": fps, "imgsz": imgsz}
+
+    def _step(self, imgsz: int, direction: int, ceiling_imgsz: int) -> int:
+        options = [s for s in IMGSZ_OPTIONS if self.min_imgsz <= s <= ceiling_imgsz]
+        if not options:
+            return ceiling_imgsz
+        lower = [s for s in options if s < imgsz]
+        higher = [s for s in options if s > imgsz]
+        if direction < 0:
+            return lower[-1] if lower else imgsz
+        return higher[0] if higher else imgsz
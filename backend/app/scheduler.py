@@ -0,0 +1,237 @@
+import asyncio
+import time
+import logging
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .detector import DEFAULT_IOU
+from .rate_control import Ewma
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# YOLO 模型非线程安全，限制为单线程
+_detect_executor = ThreadPoolExecutor(max_workers=1)
+
+DEFAULT_MAX_BATCH_SIZE = 8
+DEFAULT_MAX_WAIT_MS = 10
+
+
+class InferenceScheduler:
+    """跨连接合批推理调度器
+
+    收集所有连接在 max_wait_ms 窗口内提交的帧，凑满 max_batch_size 或超时后
+    执行一次批量推理，再把每帧结果分发回各自等待的协程。
+    只有 imgsz 与 iou 相同的帧会合入同一批次，不同设置的帧各自成批。
+    传入 pool 时批次分发给多进程推理池，否则在进程内单线程执行器中推理。
+    """
+
+    def __init__(self, detector, max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                 max_wait_ms: float = DEFAULT_MAX_WAIT_MS, pool=None):
+        self.detector = detector
+        self.pool = pool
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_ms = max(0.0, float(max_wait_ms))
+        self._queue = None
+        self._task = None
+        # (imgsz, iou) -> 待处理帧，按最早到达的分组顺序出批
+        self._pending = OrderedDict()
+        self._inflight = set()
+        # 同时进行中的批次数：进程池每个工作进程一个批次
+        self._concurrency = pool.num_workers if pool is not None else 1
+        self._slots = None
+
+        # 合批统计
+        self.total_batches = 0
+        self.total_frames = 0
+        self.batch_latency = Ewma()
+        self.batch_size = Ewma()
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self._concurrency)
+        self._task = asyncio.create_task(self._run())
+        metrics.QUEUE_DEPTH.set_function(lambda: self.queue_depth)
+        logger.info(f"[Scheduler] started, max_batch_size={self.max_batch_size}, "
+                    f"max_wait_ms={self.max_wait_ms}, concurrency={self._concurrency}")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        for task in list(self._inflight):
+            task.cancel()
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+
+        # 取消尚未处理的请求，避免调用方永久等待
+        while not self._queue.empty():
+            self._add_pending(self._queue.get_nowait())
+        for items in self._pending.values():
+            for _, _, future, *_ in items:
+                if not future.done():
+                    future.cancel()
+        self._pending.clear()
+
+    async def submit(self, image_data: bytes, conf: float = 0.25, columnar: bool = False,
+                     imgsz: int = None, iou: float = None, classes: list = None, roi: tuple = None,
+                     tile=None) -> dict:
+        """提交一帧图片，等待所在批次推理完成后返回该帧结果
+
+        批量推理统一产出列式结果，columnar=False 时再转换为字典列表。
+        imgsz / iou 未指定时使用服务端默认值。classes（类别白名单）、roi（归一化裁剪区域）
+        与 tile（TileSpec，切片推理）是逐帧设置，不影响合批；切片的帧在批次中占多块画布。
+        """
+        if self._task is None:
+            self.start()
+        key = (imgsz or self.detector.imgsz, iou if iou is not None else DEFAULT_IOU)
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((image_data, conf, future, key, classes, roi, tile))
+        result = await future
+        return result if columnar else self.detector.to_records(result)
+
+    def _add_pending(self, item):
+        key = item[3]
+        if key not in self._pending:
+            self._pending[key] = deque()
+        self._pending[key].append(item)
+
+    async def _collect_batch(self) -> list:
+        if not self._pending:
+            self._add_pending(await self._queue.get())
+        # 最早到达的分组优先出批
+        key = next(iter(self._pending))
+        group = self._pending[key]
+        deadline = time.monotonic() + self.max_wait_ms / 1000.0
+        while len(group) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                self._add_pending(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+
+        batch = [group.popleft() for _ in range(min(len(group), self.max_batch_size))]
+        if not group:
+            del self._pending[key]
+        return batch
+
+    async def _infer(self, images: list, confs: list, key: tuple, classes: list, rois: list,
+                     tiles: list) -> list:
+        imgsz, iou = key
+        if self.pool is not None:
+            return await self.pool.detect_batch(images, confs, imgsz, iou, classes, rois, tiles)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            _detect_executor, self._detect_in_process, images, confs, imgsz, iou, classes, rois, tiles
+        )
+
+    def _detect_in_process(self, images: list, confs: list, imgsz: int, iou: float,
+                           classes: list, rois: list, tiles: list) -> list:
+        # 在执行器线程内读取 last_timings，不会被其他任务覆盖
+        results = self.detector.detect_batch(images, confs, True, imgsz, iou, classes, rois, tiles)
+        metrics.observe_stages(self.detector.last_timings)
+        return results
+
+    async def run_exclusive(self, func, *args):
+        """在推理执行器中运行一个使用本进程 detector 的任务，与批量推理串行，不阻塞事件循环"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_detect_executor, func, *args)
+
+    async def warmup(self, imgsz: int) -> dict:
+        """预热指定尺寸；进程内推理时与批量推理共用执行器，不会并发使用模型"""
+        if self.pool is not None:
+            return await self.pool.warmup(imgsz)
+        return await self.run_exclusive(self.detector.warmup, imgsz)
+
+    async def release(self, imgsz: int):
+        if self.pool is not None:
+            await self.pool.release(imgsz)
+            return
+        await self.run_exclusive(self.detector.release, imgsz)
+
+    async def _run(self):
+        while True:
+            # 等到有空闲推理槽位再开始凑批，推理繁忙期间新帧会积累成更大的批次
+            await self._slots.acquire()
+            batch = await self._collect_batch()
+            # 丢弃调用方已放弃等待的帧
+            batch = [item for item in batch if not item[2].done()]
+            if not batch:
+                self._slots.release()
+                continue
+
+            task = asyncio.create_task(self._process_batch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _process_batch(self, batch: list):
+        try:
+            images = [item[0] for item in batch]
+            confs = [item[1] for item in batch]
+            classes = [item[4] for item in batch]
+            rois = [item[5] for item in batch]
+            tiles = [item[6] for item in batch]
+            start = time.perf_counter()
+            try:
+                results = await self._infer(images, confs, batch[0][3], classes, rois, tiles)
+            except Exception as e:
+                logger.error(f"[Scheduler] Batch inference error: {e}")
+                for _, _, future, *_ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+
+            self.total_batches += 1
+            self.total_frames += len(batch)
+            elapsed = time.perf_counter() - start
+            self.batch_latency.update(elapsed)
+            self.batch_size.update(len(batch))
+            metrics.BATCH_SECONDS.observe(elapsed)
+            metrics.BATCH_SIZE.observe(len(batch))
+
+            for (_, _, future, *_), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self._slots.release()
+
+    @property
+    def queue_depth(self) -> int:
+        """等待推理的帧数"""
+        queued = self._queue.qsize() if self._queue is not None else 0
+        return queued + sum(len(items) for items in self._pending.values())
+
+    def is_backlogged(self) -> bool:
+        """积压超过一轮并发批次的容量"""
+        return self.queue_depth > self.max_batch_size * self._concurrency
+
+    def estimate_capacity_fps(self) -> float:
+        """按批次延迟与平均批大小估算全局每秒可处理帧数，尚无数据时返回无穷大"""
+        if not self.batch_latency.value:
+            return float('inf')
+        return self._concurrency * self.batch_size.value / self.batch_latency.value
+
+    def get_stats(self) -> dict:
+        avg_batch_size = self.total_frames / self.total_batches if self.total_batches else 0.0
+        return {
+            "executor": "process_pool" if self.pool is not None else "in_process",
+            "workers": self._concurrency,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "total_batches": self.total_batches,
+            "total_frames": self.total_frames,
+            "avg_batch_size": round(avg_batch_size, 2),
+            "occupancy": round(avg_batch_size / self.max_batch_size, 3),
+            "batch_latency_ms": round((self.batch_latency.value or 0) * 1000, 2),
+            "queue_depth": self.queue_depth
+        }
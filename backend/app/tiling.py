@@ -0,0 +1,114 @@
+import math
+import numpy as np
+from typing import NamedTuple
+
+
+class TileSpec(NamedTuple):
+    """切片推理参数（SAHI 风格），随帧传递给推理进程
+
+    tile_size 为原图像素下的切片边长，切片之间按 overlap 比例重叠；切片数超过 max_tiles 时
+    放大切片边长直到满足上限，使每帧的推理开销可预期。full_frame 时额外推理一次整帧，
+    保证跨越多个切片的大目标完整。
+    """
+    tile_size: int = 640
+    overlap: float = 0.2
+    max_tiles: int = 6
+    full_frame: bool = True
+    # 跨切片合并的阈值：交集 / 较小框面积（IoS），边界处被截断的框面积小，用 IoU 难以匹配
+    merge_threshold: float = 0.5
+
+    @classmethod
+    def from_config(cls, config: dict) -> "TileSpec":
+        return cls(**{key: config[key] for key in cls._fields if key in config})
+
+
+def _axis(length: float, tile: float, overlap: float) -> list:
+    """一个方向上的切片起止位置，首尾切片贴齐边缘"""
+    if length <= tile:
+        return [(0.0, length)]
+    count = math.ceil((length - tile * overlap) / (tile * (1 - overlap)))
+    step = (length - tile) / (count - 1)
+    return [(i * step, i * step + tile) for i in range(count)]
+
+
+def _grid(region_w: float, region_h: float, spec: TileSpec) -> tuple:
+    """返回 (切片边长, 横向切片, 纵向切片)，切片数超过上限时放大边长"""
+    tile = float(spec.tile_size)
+    overlap = min(max(spec.overlap, 0.0), 0.9)
+    while True:
+        xs = _axis(region_w, tile, overlap)
+        ys = _axis(region_h, tile, overlap)
+        if len(xs) * len(ys) <= max(1, spec.max_tiles):
+            return tile, xs, ys
+        tile *= 1.25
+
+
+def tile_side(width: int, height: int, roi: tuple, spec: TileSpec) -> float:
+    """切片在原图中的边长（像素），区域不需要切分时返回区域长边"""
+    x1, y1, x2, y2 = roi if roi is not None else (0.0, 0.0, 1.0, 1.0)
+    region = max((x2 - x1) * width, (y2 - y1) * height)
+    if region <= spec.tile_size:
+        return region
+    return min(region, _grid((x2 - x1) * width, (y2 - y1) * height, spec)[0])
+
+
+def tile_views(width: int, height: int, roi: tuple, spec: TileSpec) -> list:
+    """把整帧（或 roi 区域）切成重叠切片，返回归一化 (x1, y1, x2, y2) 列表
+
+    区域不大于一个切片时不切分，返回 [roi]。full_frame 时第一个视图为整个区域。
+    """
+    x1, y1, x2, y2 = roi if roi is not None else (0.0, 0.0, 1.0, 1.0)
+    region_w, region_h = (x2 - x1) * width, (y2 - y1) * height
+    if max(region_w, region_h) <= spec.tile_size:
+        return [roi]
+
+    _, xs, ys = _grid(region_w, region_h, spec)
+    views = [roi] if spec.full_frame else []
+    for top, bottom in ys:
+        for left, right in xs:
+            views.append((
+                x1 + left / width, y1 + top / height,
+                x1 + right / width, y1 + bottom / height
+            ))
+    return views
+
+
+def merge_views(data: np.ndarray, views: np.ndarray, threshold: float) -> np.ndarray:
+    """合并多个视图的检测结果（GREEDY NMM）
+
+    data 为整帧坐标的 (N, 6)：x1, y1, x2, y2, conf, cls；views 为每行所属的视图下标。
+    同一视图内的框已由模型 NMS 处理，这里只合并来自不同视图、同类别且 IoS 超过阈值的框：
+    按置信度从高到低保留，被合并的框并入保留框的外接矩形，从而把切片边界处截断的框
+    还原为完整框。IoS 矩阵一次性向量化计算。
+    """
+    if len(data) < 2:
+        return data
+    order = np.argsort(-data[:, 4], kind='stable')
+    data = data[order]
+    views = views[order]
+
+    boxes = data[:, :4]
+    top_left = np.maximum(boxes[:, None, :2], boxes[None, :, :2])
+    bottom_right = np.minimum(boxes[:, None, 2:], boxes[None, :, 2:])
+    inter = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area = np.prod(boxes[:, 2:] - boxes[:, :2], axis=1)
+    ios = inter / np.maximum(np.minimum(area[:, None], area[None, :]), 1e-6)
+    mergeable = np.triu(
+        (ios > threshold)
+        & (data[:, 5][:, None] == data[:, 5][None, :])
+        & (views[:, None] != views[None, :]),
+        1
+    )
+
+    merged = data.copy()
+    keep = np.ones(len(data), dtype=bool)
+    for i in np.flatnonzero(mergeable.any(axis=1)):
+        if not keep[i]:
+            continue
+        members = mergeable[i] & keep
+        if not members.any():
+            continue
+        merged[i, :2] = np.minimum(boxes[i, :2], boxes[members, :2].min(axis=0))
+        merged[i, 2:4] = np.maximum(boxes[i, 2:4], boxes[members, 2:4].max(axis=0))
+        keep[members] = False
+    return merged[keep]
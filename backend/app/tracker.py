@@ -0,0 +1,191 @@
+import numpy as np
+
+# 轨迹 id 从 1 开始，0 表示该检测框未被跟踪（低分且未匹配到已有轨迹）
+UNTRACKED = 0
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """(N, 4) 与 (M, 4) 的 xyxy 框两两 IoU，返回 (N, M)"""
+    if not len(a) or not len(b):
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-6)
+
+
+def _associate(det_boxes, det_classes, track_boxes, track_classes, threshold: float) -> list:
+    """按 IoU 从高到低贪心匹配，只匹配同类别，返回 (检测下标, 轨迹下标) 列表"""
+    iou = iou_matrix(det_boxes, track_boxes)
+    iou[det_classes[:, None] != track_classes[None, :]] = 0
+    pairs = np.argwhere(iou >= threshold)
+    if not len(pairs):
+        return []
+    pairs = pairs[np.argsort(-iou[pairs[:, 0], pairs[:, 1]], kind='stable')]
+    matches = []
+    used_dets, used_tracks = set(), set()
+    for d, t in pairs.tolist():
+        if d in used_dets or t in used_tracks:
+            continue
+        used_dets.add(d)
+        used_tracks.add(t)
+        matches.append((d, t))
+    return matches
+
+
+class _Track:
+    __slots__ = ("id", "box", "velocity", "class_id", "score", "hits", "updated_at")
+
+    def __init__(self, track_id: int, box: np.ndarray, class_id: int, score: float, now: float):
+        self.id = track_id
+        self.box = box
+        self.velocity = np.zeros(4, dtype=np.float32)
+        self.class_id = class_id
+        self.score = score
+        self.hits = 1
+        self.updated_at = now
+
+    def predict(self, now: float, max_age: float) -> np.ndarray:
+        # 外推时长不超过 max_age，避免长时间未匹配的框飞出画面
+        return self.box + self.velocity * min(now - self.updated_at, max_age)
+
+    def update(self, box: np.ndarray, score: float, now: float):
+        dt = now - self.updated_at
+        if dt > 0:
+            velocity = (box - self.box) / dt
+            self.velocity = velocity if self.hits == 1 else 0.5 * self.velocity + 0.5 * velocity
+        self.box = box
+        self.score = score
+        self.hits += 1
+        self.updated_at = now
+
+
+class Tracker:
+    """单连接的轻量多目标跟踪（SORT / ByteTrack 风格）
+
+    每个轨迹按匀速模型预测位置，与当前帧检测框按类别做向量化 IoU 关联：先匹配高分框，
+    剩余轨迹再匹配低分框（ByteTrack 的二次关联，减少遮挡时断轨）；未匹配的高分框新建轨迹，
+    连续命中 min_hits 次后确认，超过 max_age 秒未匹配的轨迹删除。
+    """
+
+    def __init__(self, iou_threshold: float = 0.3, high_score: float = 0.5,
+                 max_age: float = 1.0, min_hits: int = 2):
+        self.iou_threshold = iou_threshold
+        self.high_score = high_score
+        self.max_age = max_age
+        self.min_hits = min_hits
+        self._tracks = []
+        self._next_id = 1
+        self._size = (0, 0)
+
+    @property
+    def confirmed(self) -> dict:
+        """当前存活且已确认的轨迹：track_id -> class_id"""
+        return {t.id: t.class_id for t in self._tracks if t.hits >= self.min_hits}
+
+    def has_tracks(self) -> bool:
+        return any(t.hits >= self.min_hits for t in self._tracks)
+
+    def update(self, result: dict, now: float) -> dict:
+        """用一帧列式检测结果更新轨迹，返回附带 track_ids 的结果"""
+        boxes = np.asarray(result["boxes"], dtype=np.float32).reshape(-1, 4)
+        scores = np.asarray(result["scores"], dtype=np.float32)
+        class_ids = np.asarray(result["class_ids"], dtype=np.int32)
+        track_ids = np.full(len(boxes), UNTRACKED, dtype=np.int64)
+        self._size = (result["width"], result["height"])
+
+        predicted = np.array(
+            [t.predict(now, self.max_age) for t in self._tracks], dtype=np.float32
+        ).reshape(-1, 4)
+        track_classes = np.array([t.class_id for t in self._tracks], dtype=np.int32)
+        unmatched_tracks = np.arange(len(self._tracks))
+        matched = set()
+
+        high = np.flatnonzero(scores >= self.high_score)
+        low = np.flatnonzero(scores < self.high_score)
+        for dets in (high, low):
+            if not len(dets) or not len(unmatched_tracks):
+                continue
+            pairs = _associate(
+                boxes[dets], class_ids[dets],
+                predicted[unmatched_tracks], track_classes[unmatched_tracks],
+                self.iou_threshold
+            )
+            for d, t in pairs:
+                track = self._tracks[unmatched_tracks[t]]
+                track.update(boxes[dets[d]], float(scores[dets[d]]), now)
+                track_ids[dets[d]] = track.id
+                matched.add(track.id)
+            taken = {t for _, t in pairs}
+            unmatched_tracks = np.array(
+                [idx for i, idx in enumerate(unmatched_tracks) if i not in taken], dtype=np.int64
+            )
+
+        # 未确认的轨迹一旦漏检即删除，已确认的轨迹保留 max_age 秒
+        self._tracks = [
+            t for t in self._tracks
+            if t.id in matched or (t.hits >= self.min_hits and now - t.updated_at <= self.max_age)
+        ]
+
+        for d in high:
+            if track_ids[d] == UNTRACKED:
+                track = _Track(self._next_id, boxes[d], int(class_ids[d]), float(scores[d]), now)
+                self._next_id += 1
+                self._tracks.append(track)
+                track_ids[d] = track.id
+
+        return {**result, "track_ids": track_ids.tolist()}
+
+    def predict(self, now: float) -> dict:
+        """不做检测，按运动模型给出已确认轨迹的当前位置（跳帧模式）"""
+        width, height = self._size
+        tracks = [t for t in self._tracks if t.hits >= self.min_hits and now - t.updated_at <= self.max_age]
+        boxes = np.array([t.predict(now, self.max_age) for t in tracks], dtype=np.float32).reshape(-1, 4)
+        boxes[:, 0::2] = np.clip(boxes[:, 0::2], 0, width)
+        boxes[:, 1::2] = np.clip(boxes[:, 1::2], 0, height)
+        return {
+            "boxes": boxes.tolist(),
+            "scores": [t.score for t in tracks],
+            "class_ids": [t.class_id for t in tracks],
+            "track_ids": [t.id for t in tracks],
+            "width": width,
+            "height": height
+        }
+
+
+class TrackAnnouncer:
+    """基于轨迹 id 的播报判定
+
+    每个新确认的轨迹播报一次；已播报的轨迹丢失后 absence 秒内出现的同类新轨迹视为
+    同一物体被重新捕获（遮挡、闪烁导致的断轨），不重复播报。
+    """
+
+    def __init__(self, absence: float = 5.0):
+        self.absence = absence
+        self._alive = {}
+        self._spoken = set()
+        # 已播报但丢失的轨迹：[(class_id, lost_at), ...]
+        self._lost = []
+
+    def update(self, confirmed: dict, now: float) -> list:
+        """传入当前已确认的轨迹（track_id -> class_id），返回需要播报的 class_id 列表"""
+        self._lost = [(cls, at) for cls, at in self._lost if now - at <= self.absence]
+        for track_id, class_id in self._alive.items():
+            if track_id not in confirmed and track_id in self._spoken:
+                self._spoken.discard(track_id)
+                self._lost.append((class_id, now))
+
+        speak = []
+        for track_id, class_id in confirmed.items():
+            if track_id in self._spoken:
+                continue
+            self._spoken.add(track_id)
+            reacquired = next((i for i, (cls, _) in enumerate(self._lost) if cls == class_id), None)
+            if reacquired is not None:
+                del self._lost[reacquired]
+            else:
+                speak.append(class_id)
+        self._alive = dict(confirmed)
+        return speak
@@ -0,0 +1,269 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from .audio_codec import CODEC_OPTIONS, encode, transcode
+
+# 索引中访问统计的最短落盘间隔（秒），写入 / 淘汰操作会立即落盘
+_INDEX_FLUSH_INTERVAL = 30.0
+_INDEX_FILE = 'index.json'
+
+
+def cache_key(text: str) -> str:
+    """Generate cache key for text."""
+    return hashlib.md5(text.encode()).hexdigest()
+
+
+class AudioCache:
+    """TTS 音频两级缓存
+
+    内存层：按字节预算的 LRU，命中时不访问磁盘。
+    磁盘层：tts_cache/<voice>/<md5>.<codec>，另有持久化索引 index.json 记录每个条目的
+    编码、存储大小、原始 PCM 大小、最后访问时间与命中次数，缓存大小查询与淘汰都基于索引，
+    无需遍历目录；磁盘总量超过 max_disk_bytes 时按最后访问时间淘汰最旧的条目。
+    磁盘层保存按 codec 编码后的数据；内存层按调用方要求的格式保存转码结果，
+    同一条音频对每种格式只转码一次（纯 Python 的 ADPCM 解码较慢，且持有 GIL）。
+    """
+
+    def __init__(self, root: str, memory_budget_bytes: int, max_disk_bytes: int = 0, codec: str = "pcm"):
+        self.root = root
+        self.memory_budget_bytes = memory_budget_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.codec = codec
+        self._lock = threading.Lock()
+
+        # (voice, key, codec) -> bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+
+        # "voice/key" -> {"codec", "size", "raw_size", "last_access", "hits"}
+        self._index = {}
+        self._voice_bytes = {}
+        self._raw_bytes = 0
+        self._index_dirty = False
+        self._index_saved_at = 0.0
+
+        os.makedirs(self.root, exist_ok=True)
+        self._load_index()
+
+    # ---------- 索引 ----------
+
+    def _index_path(self) -> str:
+        return os.path.join(self.root, _INDEX_FILE)
+
+    def _file_path(self, voice: str, key: str, codec: str) -> str:
+        return os.path.join(self.root, voice, f"{key}.{codec}")
+
+    def _load_index(self):
+        try:
+            with open(self._index_path(), 'r', encoding='utf-8') as f:
+                self._index = json.load(f)
+        except (OSError, ValueError):
+            # 索引缺失或损坏时扫描一次目录重建
+            self._index = self._scan()
+            self._index_dirty = True
+
+        # 补全旧版索引缺少的字段，丢弃文件已不存在的条目
+        for entry in self._index.values():
+            entry.setdefault("codec", "pcm")
+            entry.setdefault("raw_size", entry["size"])
+        self._index = {
+            entry_id: entry for entry_id, entry in self._index.items()
+            if os.path.isfile(self._file_path(*entry_id.split('/', 1), entry["codec"]))
+        }
+        self._voice_bytes = {}
+        self._raw_bytes = 0
+        for entry_id, entry in self._index.items():
+            voice = entry_id.split('/', 1)[0]
+            self._voice_bytes[voice] = self._voice_bytes.get(voice, 0) + entry["size"]
+            self._raw_bytes += entry["raw_size"]
+        self._save_index(force=True)
+
+    def _scan(self) -> dict:
+        index = {}
+        now = time.time()
+        for voice in os.listdir(self.root):
+            voice_dir = os.path.join(self.root, voice)
+            if not os.path.isdir(voice_dir):
+                continue
+            for file_name in os.listdir(voice_dir):
+                key, _, codec = file_name.rpartition('.')
+                if codec not in CODEC_OPTIONS:
+                    continue
+                size = os.path.getsize(os.path.join(voice_dir, file_name))
+                index[f"{voice}/{key}"] = {
+                    "codec": codec,
+                    "size": size,
+                    # 编码后的原始大小无法直接得知，按 ADPCM 4:1 估算
+                    "raw_size": size if codec == "pcm" else size * 4,
+                    "last_access": now,
+                    "hits": 0
+                }
+        return index
+
+    def _save_index(self, force: bool = False):
+        now = time.time()
+        if not force and (not self._index_dirty or now - self._index_saved_at < _INDEX_FLUSH_INTERVAL):
+            return
+        tmp_path = self._index_path() + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self._index_path())
+        self._index_dirty = False
+        self._index_saved_at = now
+
+    # ---------- 内存层 ----------
+
+    def _memory_put(self, voice: str, key: str, codec: str, data: bytes):
+        if len(data) > self.memory_budget_bytes:
+            return
+        old = self._memory.pop((voice, key, codec), None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        self._memory[(voice, key, codec)] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.memory_budget_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _memory_drop(self, voice: str = None, key: str = None):
+        """丢弃内存层中某个音色（或某一条音频的各种格式）的数据"""
+        for item in [item for item in self._memory
+                     if (voice is None or item[0] == voice) and (key is None or item[1] == key)]:
+            self._memory_bytes -= len(self._memory.pop(item))
+
+    # ---------- 对外接口 ----------
+
+    def contains(self, voice: str, text: str) -> bool:
+        return f"{voice}/{cache_key(text)}" in self._index
+
+    def get(self, voice: str, text: str, codec: str = "pcm") -> bytes:
+        """读取音频并转码为 codec 格式，未缓存时返回 None"""
+        key = cache_key(text)
+        entry_id = f"{voice}/{key}"
+        with self._lock:
+            entry = self._index.get(entry_id)
+            if entry is None:
+                return None
+            entry["last_access"] = time.time()
+            entry["hits"] += 1
+            self._index_dirty = True
+            stored_codec = entry["codec"]
+            self._save_index()
+
+            data = self._memory.get((voice, key, codec))
+            if data is not None:
+                self._memory.move_to_end((voice, key, codec))
+                return data
+            data = self._memory.get((voice, key, stored_codec))
+
+        if data is None:
+            try:
+                with open(self._file_path(voice, key, stored_codec), 'rb') as f:
+                    data = f.read()
+            except OSError:
+                with self._lock:
+                    current = self._index.get(entry_id)
+                    # 读取期间条目被并发的 put 替换（旧文件随之被替换或删除）：不能删掉新条目，按新条目重新读取
+                    replaced = current is not None and current is not entry
+                    if current is entry:
+                        self._remove_entry(entry_id)
+                if replaced:
+                    return self.get(voice, text, codec)
+                return None
+
+        data = transcode(data, stored_codec, codec)
+        with self._lock:
+            # 转码期间条目可能已被替换或删除，此时不写入内存层
+            if self._index.get(entry_id) is entry:
+                self._memory_put(voice, key, codec, data)
+        return data
+
+    def put(self, voice: str, text: str, pcm: bytes) -> str:
+        """按缓存的 codec 编码 PCM 音频并写入，返回文件路径"""
+        key = cache_key(text)
+        data = encode(pcm, self.codec)
+        file_path = self._file_path(voice, key, self.codec)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        # 先写临时文件再原子替换，并发读取方不会读到写了一半的文件
+        tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, file_path)
+
+        entry_id = f"{voice}/{key}"
+        with self._lock:
+            old = self._index.get(entry_id)
+            if old is not None:
+                self._voice_bytes[voice] -= old["size"]
+                self._raw_bytes -= old["raw_size"]
+                if old["codec"] != self.codec:
+                    try:
+                        os.remove(self._file_path(voice, key, old["codec"]))
+                    except OSError:
+                        pass
+            self._index[entry_id] = {
+                "codec": self.codec,
+                "size": len(data),
+                "raw_size": len(pcm),
+                "last_access": time.time(),
+                "hits": 0
+            }
+            self._voice_bytes[voice] = self._voice_bytes.get(voice, 0) + len(data)
+            self._raw_bytes += len(pcm)
+            # 旧内容的各格式转码结果一并失效
+            self._memory_drop(voice, key)
+            self._memory_put(voice, key, self.codec, data)
+            self._evict_disk()
+            self._save_index(force=True)
+        return file_path
+
+    def _remove_entry(self, entry_id: str):
+        entry = self._index.pop(entry_id, None)
+        if entry is None:
+            return
+        voice, key = entry_id.split('/', 1)
+        self._voice_bytes[voice] = self._voice_bytes.get(voice, 0) - entry["size"]
+        self._raw_bytes -= entry["raw_size"]
+        self._memory_drop(voice, key)
+        try:
+            os.remove(self._file_path(voice, key, entry["codec"]))
+        except OSError:
+            pass
+        self._index_dirty = True
+
+    def _evict_disk(self):
+        if not self.max_disk_bytes or self.total_bytes() <= self.max_disk_bytes:
+            return
+        for entry_id in sorted(self._index, key=lambda e: self._index[e]["last_access"]):
+            if self.total_bytes() <= self.max_disk_bytes:
+                break
+            self._remove_entry(entry_id)
+
+    def clear(self, voice: str = None):
+        with self._lock:
+            for entry_id in [e for e in self._index if voice is None or e.split('/', 1)[0] == voice]:
+                self._remove_entry(entry_id)
+            self._memory_drop(voice)
+            self._save_index(force=True)
+
+    def total_bytes(self) -> int:
+        return sum(self._voice_bytes.values())
+
+    def voice_bytes(self) -> dict:
+        return {voice: size for voice, size in self._voice_bytes.items() if size > 0}
+
+    def raw_bytes(self) -> int:
+        """全部条目解码为 PCM 后的大小"""
+        return self._raw_bytes
+
+    def stats(self) -> dict:
+        return {
+            "codec": self.codec,
+            "entries": len(self._index),
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes
+        }
@@ -1,61 +1,81 @@
 import os
-import json
-import yaml
-import base64
 import time
+import asyncio
 import threading
-import hashlib
-import dashscope
-from dashscope.audio.qwen_tts_realtime import *
+import concurrent.futures
+
+from .tts_cache import AudioCache
+from .audio_codec import AdpcmEncoder, encode
+from .config import get_section
+from . import metrics
 
-_config = None
 _tts_lock = threading.Lock()
 
 # 磁盘缓存目录
 _CACHE_DIR = os.path.join(os.path.dirname(__file__), '..', 'tts_cache')
 
-
-def _get_voice_cache_dir(voice: str) -> str:
-    """获取指定音色的缓存目录"""
-    voice_dir = os.path.join(_CACHE_DIR, voice)
-    if not os.path.exists(voice_dir):
-        os.makedirs(voice_dir, exist_ok=True)
-    return voice_dir
-
-
-def _ensure_cache_dir():
-    """确保缓存目录存在"""
-    if not os.path.exists(_CACHE_DIR):
-        os.makedirs(_CACHE_DIR, exist_ok=True)
+_cache = None
+_cache_lock = threading.Lock()
+
+_pool = None
+
+
+def _get_cache() -> AudioCache:
+    """获取音频缓存（内存 LRU + 磁盘），首次使用时按配置创建"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                config = get_tts_config()
+                _cache = AudioCache(
+                    _CACHE_DIR,
+                    memory_budget_bytes=int(config.get('cache_memory_mb', 16) * 1024 * 1024),
+                    max_disk_bytes=int(config.get('cache_max_disk_mb', 200) * 1024 * 1024),
+                    codec=config.get('cache_codec', 'pcm')
+                )
+    return _cache
+
+
+def preload_sdk():
+    """导入 dashscope SDK（tts_pool）
+
+    SDK 导入需要约一秒，未启用 TTS 时不导入；启用时在启动阶段或开关打开时于线程中预先导入，
+    避免首次播报时阻塞事件循环。
+    """
+    from . import tts_pool
+    return tts_pool
+
+
+def get_tts_pool():
+    """获取常驻 TTS 会话池，首次使用时按配置创建"""
+    global _pool
+    if _pool is None:
+        TTSSessionPool = preload_sdk().TTSSessionPool
+        config = get_tts_config()
+        _pool = TTSSessionPool(
+            size=config.get('pool_size', 2),
+            timeout=config.get('timeout', 10)
+        )
+    return _pool
 
 
-def load_config():
-    global _config
-    config_path = os.path.join(os.path.dirname(__file__), '..', 'config.yaml')
-    with open(config_path, 'r', encoding='utf-8') as f:
-        _config = yaml.safe_load(f)
-    return _config
+def close_tts_pool():
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        _pool = None
 
 
 def get_tts_config():
-    global _config
-    if _config is None:
-        load_config()
-    return _config.get('tts', {})
+    return get_section('tts')
 
 
 def get_detection_config():
-    global _config
-    if _config is None:
-        load_config()
-    return _config.get('detection', {})
+    return get_section('detection')
 
 
 def set_tts_enabled(enabled: bool):
-    global _config
-    if _config is None:
-        load_config()
-    _config['tts']['enabled'] = enabled
+    get_section('tts')['enabled'] = enabled
 
 
 def get_tts_voice():
@@ -65,68 +85,47 @@ def get_tts_voice():
 
 
 def set_tts_voice(voice: str):
-    """设置 TTS 音色"""
-    global _config
-    if _config is None:
-        load_config()
-    _config['tts']['voice'] = voice
+    """设置 TTS 音色，切换到缓存未就绪的音色时在后台预合成播报语句"""
+    config = get_section('tts')
+    previous = config.get('voice')
+    config['voice'] = voice
+    if voice != previous and config.get('enabled', False) \
+            and config.get('presynth_on_switch', True):
+        from .tts_presynth import get_presynthesizer
+        presynthesizer = get_presynthesizer()
+        if not presynthesizer.is_warm(voice):
+            presynthesizer.start(voice)
 
 
-def _get_cache_key(text: str) -> str:
-    """Generate cache key for text."""
-    return hashlib.md5(text.encode()).hexdigest()
+def announcement_text(class_name: str) -> str:
+    """检测到新目标时的播报语句"""
+    return f"我看到了{class_name}"
 
 
-def _get_audio_file_path(voice: str, text: str) -> str:
-    """获取音频文件的完整路径"""
-    key = _get_cache_key(text)
-    voice_dir = _get_voice_cache_dir(voice)
-    return os.path.join(voice_dir, f"{key}.pcm")
+def is_cached(text: str, voice: str = None) -> bool:
+    """音频是否已缓存（不计入命中统计）"""
+    return _get_cache().contains(voice or get_tts_voice(), text)
 
 
-def _get_cached_audio(text: str) -> bytes:
-    """从磁盘缓存获取音频"""
-    voice = get_tts_voice()
-    file_path = _get_audio_file_path(voice, text)
-    
-    if os.path.exists(file_path):
-        with open(file_path, 'rb') as f:
-            return f.read()
-    return None
+def _get_cached_audio(text: str, voice: str = None, codec: str = 'pcm') -> bytes:
+    """从缓存获取音频（先查内存，再查磁盘），按需转码为 codec 格式"""
+    audio_data = _get_cache().get(voice or get_tts_voice(), text, codec)
+    (metrics.TTS_CACHE_HIT if audio_data else metrics.TTS_CACHE_MISS).inc()
+    return audio_data
 
 
-def _set_cached_audio(text: str, audio_data: bytes):
-    """将音频写入磁盘缓存"""
-    voice = get_tts_voice()
-    file_path = _get_audio_file_path(voice, text)
-    
-    _ensure_cache_dir()
-    with open(file_path, 'wb') as f:
-        f.write(audio_data)
-    
+def _set_cached_audio(text: str, audio_data: bytes, voice: str = None):
+    """将音频写入缓存"""
+    file_path = _get_cache().put(voice or get_tts_voice(), text, audio_data)
     print(f'[TTS] Cached audio to {file_path}')
 
 
 def get_cache_size() -> dict:
-    """获取缓存大小信息"""
-    _ensure_cache_dir()
-    
-    total_size = 0
-    voice_sizes = {}
-    
-    try:
-        for voice_dir_name in os.listdir(_CACHE_DIR):
-            voice_dir = os.path.join(_CACHE_DIR, voice_dir_name)
-            if os.path.isdir(voice_dir):
-                voice_size = 0
-                for file_name in os.listdir(voice_dir):
-                    file_path = os.path.join(voice_dir, file_name)
-                    if os.path.isfile(file_path):
-                        voice_size += os.path.getsize(file_path)
-                voice_sizes[voice_dir_name] = voice_size
-                total_size += voice_size
-    except Exception as e:
-        print(f'[TTS] Error getting cache size: {e}')
+    """获取缓存大小信息（基于缓存索引，无需遍历目录）"""
+    cache = _get_cache()
+    total_size = cache.total_bytes()
+    raw_size = cache.raw_bytes()
+    voice_sizes = cache.voice_bytes()
     
     # 转换为人类可读格式
     def format_size(bytes_size):
@@ -140,74 +139,199 @@ def get_cache_size() -> dict:
     return {
         "total_bytes": total_size,
         "total_readable": format_size(total_size),
-        "by_voice": {voice: format_size(size) for voice, size in voice_sizes.items()}
+        # 解码为 PCM 后的大小，与 total_bytes（实际存储大小）对比可得压缩率
+        "raw_bytes": raw_size,
+        "raw_readable": format_size(raw_size),
+        "by_voice": {voice: format_size(size) for voice, size in voice_sizes.items()},
+        **cache.stats()
     }
 
 
 def clear_cache(voice: str = None):
     """清除缓存"""
-    _ensure_cache_dir()
-    
+    _get_cache().clear(voice)
     if voice:
-        # 清除指定音色
-        voice_dir = _get_voice_cache_dir(voice)
-        if os.path.exists(voice_dir):
-            for file_name in os.listdir(voice_dir):
-                file_path = os.path.join(voice_dir, file_name)
-                if os.path.isfile(file_path):
-                    os.remove(file_path)
-            print(f'[TTS] Cleared cache for voice: {voice}')
+        print(f'[TTS] Cleared cache for voice: {voice}')
     else:
-        # 清除所有缓存
-        for voice_dir_name in os.listdir(_CACHE_DIR):
-            voice_dir = os.path.join(_CACHE_DIR, voice_dir_name)
-            if os.path.isdir(voice_dir):
-                for file_name in os.listdir(voice_dir):
-                    file_path = os.path.join(voice_dir, file_name)
-                    if os.path.isfile(file_path):
-                        os.remove(file_path)
         print('[TTS] Cleared all cache')
 
 
-class TTSCallback(QwenTtsRealtimeCallback):
+def _get_ready_config(force: bool = False) -> dict:
+    """TTS 已启用（force 为 True 时不检查）且配置了 API Key 时返回配置，否则返回 None"""
+    config = get_tts_config()
+    if not force and not config.get('enabled', False):
+        print('[TTS] Disabled')
+        return None
+    api_key = config.get('api_key', '')
+    if not api_key or api_key == 'your-dashscope-api-key':
+        print('[TTS] API key not configured')
+        return None
+    return config
+
+
+async def _synthesize_and_cache(text: str, voice: str, config: dict, on_chunk=None) -> bytes:
+    try:
+        print(f'[TTS] Synthesizing: {text}')
+        started_at = time.perf_counter()
+        audio_data = await get_tts_pool().synthesize(text, voice, config, on_chunk)
+        metrics.TTS_SYNTHESIS_POOLED.observe(time.perf_counter() - started_at)
+        print(f'[TTS] Generated audio size: {len(audio_data)} bytes')
+    except Exception as e:
+        metrics.TTS_SYNTHESIS_ERRORS.inc()
+        print(f'[TTS] Error: {e}')
+        return b''
+
+    if audio_data:
+        # 编码与写盘放到线程中，不阻塞事件循环
+        await asyncio.to_thread(_set_cached_audio, text, audio_data, voice)
+    return audio_data
+
+
+class _Flight:
+    """一次进行中的合成，异步与同步路径共用
+
+    结果通过 future 交给所有等待方（事件循环中 await，线程中阻塞等待）；
+    分片广播给所有流式订阅者，后加入的订阅者先补发已到达的分片。
+    发布与结束可以在任意线程调用，分片经 call_soon_threadsafe 投递到订阅者所在的事件循环。
+    """
+
     def __init__(self):
-        self.audio_chunks = []
-        self.complete_event = threading.Event()
-        self.error = None
-
-    def on_open(self) -> None:
-        pass
-
-    def on_close(self, close_status_code, close_msg) -> None:
-        pass
-
-    def on_event(self, response) -> None:
-        try:
-            if isinstance(response, str):
-                response = json.loads(response)
-            type = response.get('type', '')
-            if 'response.audio.delta' == type:
-                recv_audio_b64 = response.get('delta', '')
-                if recv_audio_b64:
-                    self.audio_chunks.append(recv_audio_b64)
-            if 'response.done' == type or 'session.finished' == type:
-                self.complete_event.set()
-        except Exception as e:
-            self.error = str(e)
-            self.complete_event.set()
-
-    def wait_for_finished(self, timeout=10):
-        self.complete_event.wait(timeout=timeout)
-
-    def get_audio_data(self):
-        return b''.join(base64.b64decode(chunk) for chunk in self.audio_chunks)
-
-
-def synthesize_speech(text: str) -> bytes:
+        self.task = None
+        self.future = concurrent.futures.Future()
+        self.chunks = []
+        self._queues = []
+        self._lock = threading.Lock()
+
+    def publish(self, chunk: bytes):
+        with self._lock:
+            self.chunks.append(chunk)
+            queues = list(self._queues)
+        for loop, queue in queues:
+            loop.call_soon_threadsafe(queue.put_nowait, chunk)
+
+    def finish(self, audio_data: bytes):
+        with self._lock:
+            queues, self._queues = self._queues, []
+            self.future.set_result(audio_data)
+        for loop, queue in queues:
+            loop.call_soon_threadsafe(queue.put_nowait, None)
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue()
+        with self._lock:
+            for chunk in self.chunks:
+                queue.put_nowait(chunk)
+            if self.future.done():
+                queue.put_nowait(None)
+            else:
+                self._queues.append((asyncio.get_running_loop(), queue))
+        return queue
+
+
+# 进程内合成单飞：(voice, text) -> 进行中的合成，异步请求与同步请求（预合成线程）共用，
+# 并发请求同一语句时只合成一次
+_flights = {}
+
+
+def _join_flight(key: tuple) -> tuple:
+    """返回 (flight, leader)，leader 为 True 时调用方负责合成并调用 _end_flight"""
+    with _tts_lock:
+        flight = _flights.get(key)
+        if flight is not None:
+            return flight, False
+        flight = _flights[key] = _Flight()
+        return flight, True
+
+
+def _end_flight(key: tuple, flight: _Flight, audio_data: bytes):
+    # 先出表再通知等待方：合成结果已写入缓存，之后的请求直接命中缓存
+    with _tts_lock:
+        if _flights.get(key) is flight:
+            del _flights[key]
+    flight.finish(audio_data)
+
+
+def _get_flight(text: str, voice: str, config: dict) -> _Flight:
+    key = (voice, text)
+    flight, leader = _join_flight(key)
+    if leader:
+        def on_done(task):
+            failed = task.cancelled() or task.exception() is not None
+            _end_flight(key, flight, b'' if failed else task.result())
+
+        flight.task = asyncio.create_task(_synthesize_and_cache(text, voice, config, flight.publish))
+        flight.task.add_done_callback(on_done)
+    return flight
+
+
+async def synthesize_speech_async(text: str, voice: str = None, codec: str = 'pcm',
+                                  force: bool = False) -> bytes:
+    """通过常驻会话池合成语音，等待期间不占用线程；返回 codec 格式的音频
+
+    force 为 True 时忽略 enabled 开关（用于预合成）。
+    """
+    config = _get_ready_config(force)
+    if config is None:
+        return b''
+    voice = voice or config.get('voice', 'Cherry')
+
+    cached_audio = await asyncio.to_thread(_get_cached_audio, text, voice, codec)
+    if cached_audio:
+        print(f'[TTS] Cache hit for: {text}')
+        return cached_audio
+
+    # shield：单个调用方被取消时不影响其他等待同一合成的调用方
+    audio_data = await asyncio.shield(asyncio.wrap_future(_get_flight(text, voice, config).future))
+    if audio_data and codec != 'pcm':
+        audio_data = await asyncio.to_thread(encode, audio_data, codec)
+    return audio_data
+
+
+async def stream_speech(text: str, voice: str = None, codec: str = 'pcm'):
+    """流式合成：音频分片一到达就产出，同时完整音频写入缓存；缓存命中时一次产出全部音频
+
+    合成在独立任务中进行，调用方中途停止迭代（如客户端断开）也会完成并写入缓存；
+    并发请求同一语句时共享一次合成，各自收到完整的分片序列。
+    codec 为 adpcm 时每个分片都是可单独解码的 ADPCM 块。
+    """
+    config = _get_ready_config()
+    if config is None:
+        return
+    voice = voice or config.get('voice', 'Cherry')
+
+    cached_audio = await asyncio.to_thread(_get_cached_audio, text, voice, codec)
+    if cached_audio:
+        print(f'[TTS] Cache hit for: {text}')
+        yield cached_audio
+        return
+
+    encoder = AdpcmEncoder() if codec == 'adpcm' else None
+    queue = _get_flight(text, voice, config).subscribe()
+
+    remainder = b''
+    while True:
+        chunk = await queue.get()
+        if chunk is None:
+            break
+        # 16bit PCM 按样本边界切分，奇数字节留到下一片
+        chunk = remainder + chunk
+        cut = len(chunk) - len(chunk) % 2
+        remainder = chunk[cut:]
+        if cut:
+            yield encoder.encode(chunk[:cut]) if encoder is not None else chunk[:cut]
+
+
+def synthesize_speech(text: str, voice: str = None, force: bool = False) -> bytes:
+    """合成语音，voice 默认使用当前音色；force 为 True 时忽略 enabled 开关（用于预合成）
+
+    与异步路径共用单飞表：同一 (voice, text) 已在合成（无论由线程还是事件循环发起）时等待其结果，
+    不再重复合成。不能在事件循环线程中调用。
+    """
     config = get_tts_config()
-    if not config.get('enabled', False):
+    if not force and not config.get('enabled', False):
         print('[TTS] Disabled')
         return b''
+    voice = voice or config.get('voice', 'Cherry')
     
     api_key = config.get('api_key', '')
     if not api_key or api_key == 'your-dashscope-api-key':
@@ -215,47 +339,44 @@ def synthesize_speech(text: str) -> bytes:
         return b''
     
     # 先检查磁盘缓存
-    cached_audio = _get_cached_audio(text)
+    cached_audio = _get_cached_audio(text, voice)
     if cached_audio:
         print(f'[TTS] Cache hit for: {text}')
         return cached_audio
-    
-    dashscope.api_key = api_key
-    
-    callback = TTSCallback()
-    
+
+    key = (voice, text)
+    flight, leader = _join_flight(key)
+    if not leader:
+        return flight.future.result()
+
+    audio_data = b''
+    try:
+        audio_data = _synthesize_blocking(text, voice, config)
+        # 同步合成没有中间分片，完整音频作为一个分片发给同时在流式等待的订阅者
+        if audio_data:
+            flight.publish(audio_data)
+        return audio_data
+    finally:
+        _end_flight(key, flight, audio_data)
+
+
+def _synthesize_blocking(text: str, voice: str, config: dict) -> bytes:
     try:
         print(f'[TTS] Synthesizing: {text}')
+        started_at = time.perf_counter()
         
-        tts = QwenTtsRealtime(
-            model='qwen3-tts-flash-realtime',
-            callback=callback,
-        )
-        
-        tts.connect()
-        tts.update_session(
-            voice=config.get('voice', 'Cherry'),
-            response_format=AudioFormat.PCM_24000HZ_MONO_16BIT,
-            mode='server_commit'
-        )
-        
-        tts.append_text(text)
-        tts.finish()
-        
-        callback.wait_for_finished(timeout=10)
-        
-        audio_data = callback.get_audio_data()
+        audio_data = preload_sdk().synthesize_once(text, voice, config)
+        metrics.TTS_SYNTHESIS_BLOCKING.observe(time.perf_counter() - started_at)
         print(f'[TTS] Generated audio size: {len(audio_data)} bytes')
         
-        tts.close()
-        
         # 缓存到磁盘
         if audio_data:
-            _set_cached_audio(text, audio_data)
+            _set_cached_audio(text, audio_data, voice)
         
         return audio_data
         
     except Exception as e:
+        metrics.TTS_SYNTHESIS_ERRORS.inc()
         print(f'[TTS] Error: {e}')
         import traceback
         traceback.print_exc()
@@ -0,0 +1,88 @@
+"""DashScope Qwen TTS Realtime 本地模拟服务
+
+只实现 synthesize_speech 用到的事件：收到 session.finish 后按文本长度返回一段静音 PCM
+（24kHz 16bit 单声道），可选延迟模拟合成耗时。用于在无网络 / 无 API Key 时测试预合成与缓存。
+
+用法（在 backend 目录下执行）:
+    python3 -m app.tts_mock --port 8765 --delay 0.5
+然后在 config.yaml 中设置:
+    tts:
+      api_key: "mock"
+      url: "ws://127.0.0.1:8765/api-ws/v1/realtime"
+"""
+import argparse
+import asyncio
+import base64
+import json
+import uuid
+
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+
+# 每个字符对应的音频时长（秒）
+SECONDS_PER_CHAR = 0.2
+SAMPLE_RATE = 24000
+# 每个 delta 事件携带的音频字节数
+CHUNK_BYTES = 9600
+
+
+def create_app(delay: float = 0.0) -> FastAPI:
+    app = FastAPI(title="Qwen TTS Realtime Mock")
+    app.state.sessions = 0
+
+    @app.websocket("/api-ws/v1/realtime")
+    async def realtime(websocket: WebSocket):
+        await websocket.accept()
+        app.state.sessions += 1
+        session_id = f"sess_{uuid.uuid4().hex}"
+        await websocket.send_text(json.dumps({"type": "session.created", "session": {"id": session_id}}))
+
+        text = ""
+        try:
+            while True:
+                event = json.loads(await websocket.receive_text())
+                event_type = event.get("type")
+                if event_type == "session.update":
+                    await websocket.send_text(json.dumps({"type": "session.updated", "session": event.get("session", {})}))
+                elif event_type == "input_text_buffer.append":
+                    text += event.get("text", "")
+                elif event_type in ("input_text_buffer.commit", "session.finish"):
+                    await _respond(websocket, text, delay)
+                    text = ""
+                    if event_type == "session.finish":
+                        await websocket.send_text(json.dumps({"type": "session.finished"}))
+                        await websocket.close()
+                        return
+        except WebSocketDisconnect:
+            pass
+
+    return app
+
+
+async def _respond(websocket: WebSocket, text: str, delay: float):
+    response_id = f"resp_{uuid.uuid4().hex}"
+    await websocket.send_text(json.dumps({"type": "response.created", "response": {"id": response_id}}))
+    if delay:
+        await asyncio.sleep(delay)
+    audio = bytes(int(len(text) * SECONDS_PER_CHAR * SAMPLE_RATE) * 2)
+    for offset in range(0, len(audio), CHUNK_BYTES):
+        await websocket.send_text(json.dumps({
+            "type": "response.audio.delta",
+            "response_id": response_id,
+            "delta": base64.b64encode(audio[offset:offset + CHUNK_BYTES]).decode()
+        }))
+    await websocket.send_text(json.dumps({"type": "response.done", "response": {"id": response_id}}))
+
+
+def main(argv=None):
+    import uvicorn
+
+    parser = argparse.ArgumentParser(prog="python3 -m app.tts_mock", description="Qwen TTS Realtime 本地模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.0, help="每次合成的模拟耗时（秒）")
+    args = parser.parse_args(argv)
+    uvicorn.run(create_app(args.delay), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
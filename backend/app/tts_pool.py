@@ -0,0 +1,251 @@
+import json
+import time
+import base64
+import asyncio
+import threading
+import dashscope
+from dashscope.audio.qwen_tts_realtime import *
+
+TTS_MODEL = 'qwen3-tts-flash-realtime'
+
+
+class _SessionCallback(QwenTtsRealtimeCallback):
+    def __init__(self, session):
+        self.session = session
+
+    def on_open(self) -> None:
+        pass
+
+    def on_close(self, close_status_code, close_msg) -> None:
+        self.session._on_close(close_status_code, close_msg)
+
+    def on_event(self, response) -> None:
+        self.session._on_event(response)
+
+
+class _Session:
+    """一条常驻的 QwenTtsRealtime 会话（commit 模式），可连续合成多条语句
+
+    SDK 的回调运行在 WebSocket 线程中，结果通过 call_soon_threadsafe 交回事件循环，
+    等待合成完成时不占用线程。
+    """
+
+    def __init__(self, voice: str, loop: asyncio.AbstractEventLoop):
+        self.voice = voice
+        self.loop = loop
+        self.closed = False
+        self._tts = None
+        self._chunks = []
+        self._future = None
+        self._on_chunk = None
+
+    def connect(self, config: dict):
+        """建立连接并设置音色（阻塞，需在线程中调用）"""
+        self._tts = QwenTtsRealtime(
+            model=TTS_MODEL,
+            callback=_SessionCallback(self),
+            url=config.get('url') or None,
+        )
+        self._tts.connect()
+        self._tts.update_session(
+            voice=self.voice,
+            response_format=AudioFormat.PCM_24000HZ_MONO_16BIT,
+            mode='commit'
+        )
+
+    def _on_event(self, response):
+        try:
+            if isinstance(response, str):
+                response = json.loads(response)
+            type = response.get('type', '')
+            if 'response.audio.delta' == type:
+                delta = response.get('delta', '')
+                if delta:
+                    chunk = base64.b64decode(delta)
+                    self._chunks.append(chunk)
+                    if self._on_chunk is not None:
+                        self.loop.call_soon_threadsafe(self._on_chunk, chunk)
+            elif 'response.done' == type:
+                self.loop.call_soon_threadsafe(self._resolve, None)
+            elif 'error' == type:
+                error = RuntimeError(f"TTS service error: {response.get('error')}")
+                self.loop.call_soon_threadsafe(self._resolve, error)
+        except Exception as e:
+            self.loop.call_soon_threadsafe(self._resolve, e)
+
+    def _on_close(self, close_status_code, close_msg):
+        self.closed = True
+        error = ConnectionError(f"TTS session closed: {close_status_code} {close_msg}")
+        self.loop.call_soon_threadsafe(self._resolve, error)
+
+    def _resolve(self, error):
+        future = self._future
+        if future is None or future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(b''.join(self._chunks))
+
+    @property
+    def received(self) -> bool:
+        return bool(self._chunks)
+
+    async def synthesize(self, text: str, timeout: float, on_chunk=None) -> bytes:
+        """合成一条语句；on_chunk 在事件循环中按到达顺序收到每个音频分片"""
+        self._chunks = []
+        self._on_chunk = on_chunk
+        self._future = self.loop.create_future()
+        try:
+            self._tts.append_text(text)
+            self._tts.commit()
+            return await asyncio.wait_for(self._future, timeout)
+        finally:
+            self._future = None
+            self._on_chunk = None
+
+    def close(self):
+        self.closed = True
+        try:
+            self._tts.close()
+        except Exception:
+            pass
+
+
+class TTSSessionPool:
+    """按音色复用常驻 TTS 会话
+
+    每个音色最多 size 条会话同时合成，空闲会话留在池中供后续语句复用，省去每次的
+    WebSocket 握手与会话初始化。连接失败时按指数退避重连；复用的会话已被服务端
+    关闭时换新会话重试一次。
+    """
+
+    def __init__(self, size: int = 2, timeout: float = 10.0,
+                 backoff_base: float = 0.5, backoff_max: float = 30.0):
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._idle = {}
+        self._slots = {}
+        self._failures = {}
+        self._retry_at = {}
+
+    async def synthesize(self, text: str, voice: str, config: dict, on_chunk=None) -> bytes:
+        dashscope.api_key = config['api_key']
+        slots = self._slots.setdefault(voice, asyncio.Semaphore(self.size))
+        async with slots:
+            for attempt in range(2):
+                session, reused = await self._acquire(voice, config)
+                try:
+                    audio_data = await session.synthesize(text, self.timeout, on_chunk)
+                except Exception:
+                    # 超时或出错的会话可能还会收到旧响应，直接丢弃
+                    session.close()
+                    # 已向调用方输出过分片时不能重试，否则音频会重复
+                    if reused and attempt == 0 and not session.received:
+                        continue
+                    raise
+                self._idle[voice].append(session)
+                return audio_data
+
+    async def _acquire(self, voice: str, config: dict) -> tuple:
+        idle = self._idle.setdefault(voice, [])
+        while idle:
+            session = idle.pop()
+            if not session.closed:
+                return session, True
+
+        delay = self._retry_at.get(voice, 0.0) - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        session = _Session(voice, asyncio.get_running_loop())
+        try:
+            await asyncio.to_thread(session.connect, config)
+        except Exception:
+            session.close()
+            failures = self._failures.get(voice, 0) + 1
+            self._failures[voice] = failures
+            backoff = min(self.backoff_max, self.backoff_base * 2 ** (failures - 1))
+            self._retry_at[voice] = time.monotonic() + backoff
+            print(f'[TTS] Connect failed for voice {voice}, retry in {backoff:.1f}s')
+            raise
+        self._failures[voice] = 0
+        return session, False
+
+    def close(self):
+        for sessions in self._idle.values():
+            for session in sessions:
+                session.close()
+        self._idle.clear()
+
+    def get_stats(self) -> dict:
+        return {
+            "size": self.size,
+            "idle": {voice: len(sessions) for voice, sessions in self._idle.items()},
+            "failures": dict(self._failures)
+        }
+
+
+class TTSCallback(QwenTtsRealtimeCallback):
+    def __init__(self):
+        self.audio_chunks = []
+        self.complete_event = threading.Event()
+        self.error = None
+
+    def on_open(self) -> None:
+        pass
+
+    def on_close(self, close_status_code, close_msg) -> None:
+        pass
+
+    def on_event(self, response) -> None:
+        try:
+            if isinstance(response, str):
+                response = json.loads(response)
+            type = response.get('type', '')
+            if 'response.audio.delta' == type:
+                recv_audio_b64 = response.get('delta', '')
+                if recv_audio_b64:
+                    self.audio_chunks.append(recv_audio_b64)
+            if 'response.done' == type or 'session.finished' == type:
+                self.complete_event.set()
+        except Exception as e:
+            self.error = str(e)
+            self.complete_event.set()
+
+    def wait_for_finished(self, timeout=10):
+        self.complete_event.wait(timeout=timeout)
+
+    def get_audio_data(self):
+        return b''.join(base64.b64decode(chunk) for chunk in self.audio_chunks)
+
+
+def synthesize_once(text: str, voice: str, config: dict, timeout: float = 10) -> bytes:
+    """新建一条会话合成一条语句（server_commit 模式，阻塞），用于同步预合成"""
+    dashscope.api_key = config['api_key']
+    callback = TTSCallback()
+    tts = QwenTtsRealtime(
+        model=TTS_MODEL,
+        callback=callback,
+        # 可指向本地模拟服务（python3 -m app.tts_mock）用于测试
+        url=config.get('url') or None,
+    )
+    
+    tts.connect()
+    tts.update_session(
+        voice=voice,
+        response_format=AudioFormat.PCM_24000HZ_MONO_16BIT,
+        mode='server_commit'
+    )
+    
+    tts.append_text(text)
+    tts.finish()
+    
+    callback.wait_for_finished(timeout=timeout)
+    
+    audio_data = callback.get_audio_data()
+    tts.close()
+    return audio_data
@@ -0,0 +1,143 @@
+import time
+import asyncio
+import threading
+
+from .detector import COCO_CLASSES_CN
+from . import tts_handler
+
+DEFAULT_CONCURRENCY = 4
+
+
+def announcement_texts() -> list:
+    """所有类别的播报语句（去重并保持类别顺序）"""
+    return list(dict.fromkeys(tts_handler.announcement_text(name) for name in COCO_CLASSES_CN.values()))
+
+
+class Presynthesizer:
+    """按音色批量预合成全部类别的播报语句
+
+    每个音色同时只有一个任务，任务在事件循环中以有限并发调用 synthesize_speech_async，
+    经常驻会话池合成（不必每条语句新建一次连接），并与实时播报共用单飞表；
+    已缓存的语句直接跳过，进度通过 get_status 查询。
+    """
+
+    def __init__(self, concurrency: int = DEFAULT_CONCURRENCY):
+        self.concurrency = max(1, concurrency)
+        self._lock = threading.Lock()
+        # voice -> 任务状态
+        self._jobs = {}
+        # voice -> 后台 asyncio 任务
+        self._tasks = {}
+
+    def is_warm(self, voice: str) -> bool:
+        return all(tts_handler.is_cached(text, voice) for text in announcement_texts())
+
+    def start(self, voice: str) -> dict:
+        """在事件循环中后台启动预合成任务（须在事件循环线程中调用），该音色已有任务在运行时直接返回其状态"""
+        with self._lock:
+            job = self._jobs.get(voice)
+            if job is not None and job["state"] == "running":
+                return dict(job)
+            job = self._new_job(voice)
+            self._jobs[voice] = job
+        task = asyncio.get_running_loop().create_task(self._run(job))
+        self._tasks[voice] = task
+        task.add_done_callback(lambda _: self._tasks.pop(voice, None))
+        return dict(job)
+
+    def run(self, voice: str, progress=None) -> dict:
+        """同步执行预合成（供命令行使用），progress(job) 在每条语句完成后回调"""
+        with self._lock:
+            job = self._new_job(voice)
+            self._jobs[voice] = job
+
+        async def run_job():
+            try:
+                await self._run(job, progress)
+            finally:
+                # 会话池绑定在本次 asyncio.run 的事件循环上
+                tts_handler.close_tts_pool()
+
+        asyncio.run(run_job())
+        return dict(job)
+
+    async def close(self):
+        """取消进行中的任务（服务关闭时调用）"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _new_job(self, voice: str) -> dict:
+        return {
+            "voice": voice,
+            "state": "running",
+            "total": len(announcement_texts()),
+            "completed": 0,
+            "cached": 0,
+            "failed": 0,
+            "started_at": time.time(),
+            "elapsed_s": 0.0
+        }
+
+    async def _run(self, job: dict, progress=None):
+        voice = job["voice"]
+        # 首次使用时加载缓存索引与 SDK，放到线程中避免阻塞事件循环
+        await asyncio.to_thread(tts_handler.preload_sdk)
+        pending = await asyncio.to_thread(
+            lambda: [text for text in announcement_texts() if not tts_handler.is_cached(text, voice)]
+        )
+        job["cached"] = job["completed"] = job["total"] - len(pending)
+        print(f'[TTS] Presynthesizing {len(pending)} phrases for voice {voice} '
+              f'({job["cached"]} already cached)')
+
+        limit = asyncio.Semaphore(self.concurrency)
+
+        async def synthesize(text: str):
+            async with limit:
+                try:
+                    audio_data = await tts_handler.synthesize_speech_async(text, voice, force=True)
+                except Exception:
+                    audio_data = b''
+            with self._lock:
+                job["completed"] += 1
+                if not audio_data:
+                    job["failed"] += 1
+                job["elapsed_s"] = round(time.time() - job["started_at"], 1)
+            if progress is not None:
+                progress(dict(job))
+
+        try:
+            await asyncio.gather(*(synthesize(text) for text in pending))
+        except asyncio.CancelledError:
+            job["state"] = "cancelled"
+            raise
+        finally:
+            job["elapsed_s"] = round(time.time() - job["started_at"], 1)
+
+        job["state"] = "failed" if job["failed"] == len(pending) and pending else "done"
+        print(f'[TTS] Presynthesis for voice {voice} {job["state"]}: '
+              f'{job["completed"]}/{job["total"]}, {job["failed"]} failed, {job["elapsed_s"]}s')
+
+    def get_status(self, voice: str = None) -> dict:
+        with self._lock:
+            if voice is not None:
+                job = self._jobs.get(voice)
+                return dict(job) if job is not None else {"voice": voice, "state": "idle"}
+            return {voice: dict(job) for voice, job in self._jobs.items()}
+
+
+_presynthesizer = None
+
+
+def get_presynthesizer() -> Presynthesizer:
+    global _presynthesizer
+    if _presynthesizer is None:
+        concurrency = tts_handler.get_tts_config().get('presynth_concurrency', DEFAULT_CONCURRENCY)
+        _presynthesizer = Presynthesizer(concurrency)
+    return _presynthesizer
+
+
+async def close_presynthesizer():
+    if _presynthesizer is not None:
+        await _presynthesizer.close()
@@ -0,0 +1,343 @@
+"""离线视频处理流水线
+
+读取本地视频文件（或 OpenCV 支持的 RTSP / HTTP 流），后台线程解码，帧经合批调度器推理，
+检测结果按帧顺序流式写入 JSONL 或 Parquet：
+
+    解码线程 --(有界队列)--> 提交窗口（最多 window 帧在推理中）--> 写出线程按帧顺序写出
+
+解码线程在队列满时阻塞，提交窗口满时等待最早的帧完成，内存占用与视频长度无关。
+解码后的帧以 BGR 数组直接送入预处理，不再编码为 JPEG。
+"""
+import os
+import json
+import time
+import uuid
+import functools
+import asyncio
+import logging
+import threading
+import importlib.util
+import concurrent.futures
+from collections import deque
+
+import cv2
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_FORMATS = ["jsonl", "parquet"]
+DEFAULT_QUEUE_SIZE = 32
+# 开启 allow_urls 后 /api/video/jobs 接受的流地址协议（不含 file:// 等可读本地文件的协议）
+URL_SCHEMES = ("rtsp", "rtsps", "rtmp", "http", "https")
+# Parquet 每个 row group 的检测框行数
+PARQUET_ROW_GROUP = 10000
+
+
+class _JsonlWriter:
+    """每帧一行：frame, timestamp_ms, width, height, detections"""
+
+    def __init__(self, path: str, names: list):
+        self.names = names
+        self._file = open(path, 'w', encoding='utf-8')
+
+    def write(self, index: int, timestamp_ms: float, result: dict):
+        detections = [
+            {"bbox": [round(v, 2) for v in box], "confidence": round(score, 4),
+             "class_id": class_id, "class_name": self.names[class_id]}
+            for box, score, class_id in zip(result["boxes"], result["scores"], result["class_ids"])
+        ]
+        self._file.write(json.dumps({
+            "frame": index,
+            "timestamp_ms": round(timestamp_ms, 3),
+            "width": result["width"],
+            "height": result["height"],
+            "detections": detections
+        }, ensure_ascii=False) + "\n")
+
+    def close(self):
+        self._file.close()
+
+
+class _ParquetWriter:
+    """每个检测框一行，按 row group 分批写出；没有检测框的帧不产生行"""
+
+    COLUMNS = ("frame", "timestamp_ms", "width", "height", "class_id", "class_name",
+               "confidence", "x1", "y1", "x2", "y2")
+
+    def __init__(self, path: str, names: list):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("parquet output requires pyarrow (pip install pyarrow)")
+        self._pa = pa
+        self.names = names
+        self._schema = pa.schema([
+            ("frame", pa.int64()), ("timestamp_ms", pa.float64()),
+            ("width", pa.int32()), ("height", pa.int32()),
+            ("class_id", pa.int32()), ("class_name", pa.string()), ("confidence", pa.float32()),
+            ("x1", pa.float32()), ("y1", pa.float32()), ("x2", pa.float32()), ("y2", pa.float32())
+        ])
+        self._writer = pq.ParquetWriter(path, self._schema)
+        self._rows = {column: [] for column in self.COLUMNS}
+
+    def write(self, index: int, timestamp_ms: float, result: dict):
+        rows = self._rows
+        for box, score, class_id in zip(result["boxes"], result["scores"], result["class_ids"]):
+            rows["frame"].append(index)
+            rows["timestamp_ms"].append(timestamp_ms)
+            rows["width"].append(result["width"])
+            rows["height"].append(result["height"])
+            rows["class_id"].append(class_id)
+            rows["class_name"].append(self.names[class_id])
+            rows["confidence"].append(score)
+            for column, value in zip(("x1", "y1", "x2", "y2"), box):
+                rows[column].append(value)
+        if len(rows["frame"]) >= PARQUET_ROW_GROUP:
+            self._flush()
+
+    def _flush(self):
+        if self._rows["frame"]:
+            self._writer.write_table(self._pa.table(self._rows, schema=self._schema))
+            self._rows = {column: [] for column in self.COLUMNS}
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+
+def resolve_format(output: str, fmt: str = None) -> str:
+    """未指定格式时按输出文件扩展名判断，默认 jsonl
+
+    格式不支持或为 parquet 但未安装 pyarrow 时抛出 ValueError，调用方在加载模型、启动任务前检查。
+    """
+    if fmt:
+        if fmt not in OUTPUT_FORMATS:
+            raise ValueError(f"format must be one of {OUTPUT_FORMATS}")
+    else:
+        fmt = "parquet" if output.endswith(".parquet") else "jsonl"
+    if fmt == "parquet" and importlib.util.find_spec("pyarrow") is None:
+        raise ValueError("parquet output requires pyarrow (pip install pyarrow)")
+    return fmt
+
+
+def _read_frames(source: str, stride: int, max_frames: int, info: dict,
+                 loop: asyncio.AbstractEventLoop, queue: asyncio.Queue, stop: threading.Event):
+    """解码线程：按 stride 抽帧放入有界队列，队列满时阻塞（背压），结束时放入 None"""
+
+    def put(item) -> bool:
+        future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+        while True:
+            try:
+                future.result(timeout=0.5)
+                return True
+            except concurrent.futures.TimeoutError:
+                if stop.is_set():
+                    future.cancel()
+                    return False
+
+    capture = cv2.VideoCapture(source)
+    try:
+        if not capture.isOpened():
+            put(RuntimeError(f"cannot open video source: {source}"))
+            return
+        fps = capture.get(cv2.CAP_PROP_FPS) or 0.0
+        info["fps"] = round(fps, 3)
+        info["total_frames"] = int(capture.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+
+        index = -1
+        produced = 0
+        while not stop.is_set():
+            # 跳过的帧只 grab 不 retrieve，省去像素格式转换
+            if not capture.grab():
+                break
+            index += 1
+            if index % stride:
+                continue
+            ok, frame = capture.retrieve()
+            if not ok:
+                break
+            timestamp_ms = capture.get(cv2.CAP_PROP_POS_MSEC)
+            if not timestamp_ms and fps:
+                timestamp_ms = index * 1000.0 / fps
+            if not put((index, timestamp_ms, frame)):
+                return
+            produced += 1
+            if max_frames and produced >= max_frames:
+                break
+    except Exception as e:
+        put(e)
+    finally:
+        capture.release()
+        if not stop.is_set():
+            put(None)
+
+
+async def process_video(scheduler, source: str, output: str, fmt: str = None,
+                        conf: float = 0.25, imgsz: int = None, iou: float = None,
+                        classes: list = None, roi: tuple = None, tile=None,
+                        stride: int = 1, max_frames: int = 0, window: int = None,
+                        queue_size: int = DEFAULT_QUEUE_SIZE, progress=None) -> dict:
+    """处理一个视频，返回统计信息；progress(stats) 在每写出一帧后回调
+
+    window 为同时在推理中的最大帧数，默认两个批次：一批推理时下一批已在调度器中排队。
+    被取消时已写出的结果保留在输出文件中。
+    """
+    fmt = resolve_format(output, fmt)
+    stride = max(1, int(stride))
+    window = window or scheduler.max_batch_size * 2
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=max(1, queue_size))
+    stop = threading.Event()
+    stats = {"source": source, "output": output, "format": fmt, "fps": 0.0, "total_frames": 0,
+             "frames": 0, "detections": 0, "elapsed_s": 0.0, "throughput_fps": 0.0}
+
+    names = scheduler.detector.names_en
+    writer_class = _ParquetWriter if fmt == "parquet" else _JsonlWriter
+    # 结果的序列化与写盘（含 Parquet row group 刷盘）在专用线程中按顺序执行，不阻塞事件循环
+    write_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="video-writer")
+    try:
+        writer = await loop.run_in_executor(write_executor, writer_class, output, names)
+    except BaseException:
+        write_executor.shutdown(wait=False)
+        raise
+    reader = threading.Thread(
+        target=_read_frames, args=(source, stride, max_frames, stats, loop, queue, stop), daemon=True
+    )
+    started_at = time.perf_counter()
+    reader.start()
+    # (帧号, 时间戳, 推理任务)，按帧顺序写出
+    pending = deque()
+
+    async def write_oldest():
+        index, timestamp_ms, task = pending.popleft()
+        result = await task
+        await loop.run_in_executor(write_executor, writer.write, index, timestamp_ms, result)
+        stats["frames"] += 1
+        stats["detections"] += len(result["class_ids"])
+        elapsed = time.perf_counter() - started_at
+        stats["elapsed_s"] = round(elapsed, 2)
+        stats["throughput_fps"] = round(stats["frames"] / elapsed, 2) if elapsed else 0.0
+        if progress is not None:
+            progress(stats)
+
+    try:
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            index, timestamp_ms, frame = item
+            task = asyncio.ensure_future(scheduler.submit(
+                frame, conf, columnar=True, imgsz=imgsz, iou=iou, classes=classes, roi=roi, tile=tile
+            ))
+            pending.append((index, timestamp_ms, task))
+            if len(pending) >= window:
+                await write_oldest()
+        while pending:
+            await write_oldest()
+    finally:
+        stop.set()
+        for _, _, task in pending:
+            task.cancel()
+        # 排在已提交的写入之后执行，取消时正在进行的写入完成后再关闭
+        await loop.run_in_executor(write_executor, writer.close)
+        write_executor.shutdown(wait=False)
+        await asyncio.to_thread(reader.join)
+    return stats
+
+
+class VideoJobManager:
+    """后台视频处理任务（/api/video/jobs）
+
+    任务在服务端事件循环中运行，与实时连接共用合批调度器；结果写入 output_dir/<job_id>.<format>。
+    本地视频只能来自 input_dir，流地址仅在 allow_urls 为 True 时接受。
+    """
+
+    def __init__(self, scheduler, output_dir: str, input_dir: str, allow_urls: bool = False,
+                 queue_size: int = DEFAULT_QUEUE_SIZE):
+        self.scheduler = scheduler
+        self.output_dir = output_dir
+        self.input_dir = os.path.realpath(input_dir)
+        self.allow_urls = allow_urls
+        self.queue_size = queue_size
+        # job_id -> (状态, asyncio 任务)
+        self._jobs = {}
+
+    def resolve_source(self, source: str) -> str:
+        """校验任务来源，返回实际打开的路径或流地址；不允许的来源抛出 ValueError
+
+        本地路径相对 input_dir 解析（绝对路径须位于其中），解析符号链接与 .. 后不在 input_dir 内的拒绝。
+        """
+        if "://" in source:
+            scheme = source.split("://", 1)[0].lower()
+            if not self.allow_urls:
+                raise ValueError("stream sources are disabled (video.allow_urls)")
+            if scheme not in URL_SCHEMES:
+                raise ValueError(f"unsupported stream scheme: {scheme}")
+            return source
+        path = os.path.realpath(os.path.join(self.input_dir, source))
+        if os.path.commonpath([self.input_dir, path]) != self.input_dir:
+            raise ValueError(f"source must be inside the video input directory: {source}")
+        if not os.path.isfile(path):
+            raise ValueError(f"video not found: {source}")
+        return path
+
+    def start(self, source: str, fmt: str = "jsonl", **options) -> dict:
+        """启动任务，source 须先经 resolve_source 校验"""
+        fmt = resolve_format("", fmt)
+        os.makedirs(self.output_dir, exist_ok=True)
+        job_id = uuid.uuid4().hex[:12]
+        output = os.path.join(self.output_dir, f"{job_id}.{fmt}")
+        job = {"id": job_id, "state": "running", "source": source, "output": output, "format": fmt,
+               "frames": 0, "total_frames": 0, "detections": 0, "throughput_fps": 0.0,
+               "elapsed_s": 0.0, "started_at": time.time(), "error": None}
+        task = asyncio.create_task(self._run(job, source, output, fmt, options))
+        task.add_done_callback(functools.partial(self._on_done, job))
+        self._jobs[job_id] = (job, task)
+        return dict(job)
+
+    async def _run(self, job: dict, source: str, output: str, fmt: str, options: dict):
+        def progress(stats):
+            for key in ("frames", "total_frames", "detections", "throughput_fps", "elapsed_s"):
+                job[key] = stats[key]
+
+        logger.info(f"[Video] job {job['id']} started: {source}")
+        try:
+            await process_video(self.scheduler, source, output, fmt, queue_size=self.queue_size,
+                                progress=progress, **options)
+            job["state"] = "done"
+        except asyncio.CancelledError:
+            job["state"] = "cancelled"
+        except Exception as e:
+            job["state"] = "failed"
+            job["error"] = str(e)
+            logger.error(f"[Video] job {job['id']} failed: {e}")
+        logger.info(f"[Video] job {job['id']} {job['state']}: {job['frames']} frames, "
+                    f"{job['throughput_fps']} fps")
+
+    @staticmethod
+    def _on_done(job: dict, task: asyncio.Task):
+        # 尚未开始执行就被取消的任务不会进入 _run 的异常处理
+        if job["state"] == "running":
+            job["state"] = "cancelled"
+
+    def cancel(self, job_id: str) -> dict:
+        entry = self._jobs.get(job_id)
+        if entry is None:
+            return None
+        job, task = entry
+        task.cancel()
+        return dict(job)
+
+    async def close(self):
+        tasks = [task for _, task in self._jobs.values() if not task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def get_status(self, job_id: str = None):
+        if job_id is not None:
+            entry = self._jobs.get(job_id)
+            return dict(entry[0]) if entry is not None else None
+        return [dict(job) for job, _ in self._jobs.values()]
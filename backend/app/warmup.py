@@ -0,0 +1,103 @@
+import asyncio
+import time
+import logging
+from collections import OrderedDict
+
+from .detector import IMGSZ_OPTIONS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUDGET_MB = 512
+
+
+def resolve_warmup_sizes(sizes) -> list:
+    """解析 inference.warmup_sizes 配置：all / 尺寸列表"""
+    if sizes is None or sizes == 'all':
+        return list(IMGSZ_OPTIONS)
+    return [imgsz for imgsz in sizes if imgsz in IMGSZ_OPTIONS]
+
+
+class WarmupManager:
+    """按 imgsz 预热推理路径
+
+    预热过的尺寸按最近使用顺序保存在 LRU 中，超出内存预算时释放最久未用的尺寸
+    （当前使用中的尺寸不会被释放）。PyTorch 后端的模型与尺寸无关，没有可按尺寸释放的资源，
+    此时只预热、不做预算淘汰，状态中 eviction 为 False。
+    """
+
+    def __init__(self, scheduler, budget_mb: float = DEFAULT_BUDGET_MB):
+        self.scheduler = scheduler
+        self.evictable = scheduler.detector.releasable
+        self.budget_bytes = int(budget_mb * 1024 * 1024) if budget_mb and self.evictable else 0
+        # imgsz -> {"warmup_ms", "memory_bytes", "warmed_at"}
+        self._entries = OrderedDict()
+        self._warming = set()
+        self._lock = asyncio.Lock()
+
+    def is_warm(self, imgsz: int) -> bool:
+        return imgsz in self._entries
+
+    def touch(self, imgsz: int):
+        if imgsz in self._entries:
+            self._entries.move_to_end(imgsz)
+
+    async def warmup(self, imgsz: int) -> dict:
+        async with self._lock:
+            if imgsz in self._entries:
+                self._entries.move_to_end(imgsz)
+                return self._entries[imgsz]
+
+            self._warming.add(imgsz)
+            try:
+                info = await self.scheduler.warmup(imgsz)
+            finally:
+                self._warming.discard(imgsz)
+            info["warmed_at"] = time.time()
+            self._entries[imgsz] = info
+            logger.info(f"[Warmup] imgsz={imgsz} warmed in {info['warmup_ms']}ms")
+
+            await self._evict(protect=imgsz)
+            return info
+
+    async def warmup_all(self, sizes: list):
+        for imgsz in sizes:
+            try:
+                await self.warmup(imgsz)
+            except Exception as e:
+                logger.error(f"[Warmup] imgsz={imgsz} failed: {e}")
+
+    async def _evict(self, protect: int):
+        if not self.evictable:
+            return
+        current = self.scheduler.detector.imgsz
+        for imgsz in list(self._entries):
+            if not self.budget_bytes or self._used_bytes() <= self.budget_bytes:
+                break
+            if imgsz in (protect, current):
+                continue
+            del self._entries[imgsz]
+            await self.scheduler.release(imgsz)
+            logger.info(f"[Warmup] imgsz={imgsz} evicted (budget {self.budget_bytes} bytes)")
+
+    def _used_bytes(self) -> int:
+        return sum(entry["memory_bytes"] for entry in self._entries.values())
+
+    def get_status(self) -> dict:
+        sizes = {}
+        for imgsz in IMGSZ_OPTIONS:
+            entry = self._entries.get(imgsz)
+            if entry is not None:
+                sizes[imgsz] = {
+                    "state": "warm",
+                    "warmup_ms": entry["warmup_ms"],
+                    "memory_mb": round(entry["memory_bytes"] / (1024 * 1024), 2)
+                }
+            else:
+                sizes[imgsz] = {"state": "warming" if imgsz in self._warming else "cold"}
+        return {
+            "eviction": self.evictable,
+            # 不可淘汰时预算不生效，返回 None
+            "budget_mb": round(self.budget_bytes / (1024 * 1024), 2) if self.evictable else None,
+            "used_mb": round(self._used_bytes() / (1024 * 1024), 2),
+            "sizes": sizes
+        }
@@ -1,19 +1,26 @@
 import asyncio
 import base64
+import itertools
+import json
 import time
 from collections import Counter
-from concurrent.futures import ThreadPoolExecutor
 from fastapi import WebSocket, WebSocketDisconnect
-from typing import Dict
+from typing import Dict, NamedTuple, Optional
 import logging
 
+from .config import get_section
 from . import tts_handler
+from .protocol import MSG_FRAME, MSG_FRAME_SEQ, unpack_frame, pack_result, pack_tts_audio
+from .detector import IMGSZ_OPTIONS, parse_classes, parse_roi
+from .rate_control import RateController
+from .tracker import Tracker, TrackAnnouncer
+from .motion_gate import MotionGate
+from .tiling import TileSpec
+from .audio_codec import CODEC_OPTIONS
+from . import metrics
 
 logger = logging.getLogger(__name__)
 
-# YOLO 模型非线程安全，限制为单线程
-_detect_executor = ThreadPoolExecutor(max_workers=1)
-_tts_executor = ThreadPoolExecutor(max_workers=2)
 
 # 物体消失多久后"忘记"它（秒），重新出现时才会再次播报
 ABSENCE_THRESHOLD = 5.0
@@ -40,34 +47,181 @@ class ConnectionManager:
         except Exception as e:
             logger.error(f"Send error: {e}")
 
+    async def send_bytes(self, websocket: WebSocket, data: bytes):
+        try:
+            await websocket.send_bytes(data)
+        except Exception as e:
+            logger.error(f"Send error: {e}")
+
 
 manager = ConnectionManager()
+metrics.ACTIVE_CONNECTIONS.set_function(lambda: len(manager.active_connections))
+
+
+class _Frame(NamedTuple):
+    seq: int
+    conf: float
+    image: bytes
+    # 客户端时间戳，原样回传；MSG_FRAME 为 None
+    client_ts: Optional[float]
+    # 服务端收到帧的时刻：perf_counter 用于计算耗时，Unix 毫秒时间戳随结果下发
+    received_at: float
+    received_ts: float
+
+
+class _FrameSlot:
+    """单连接的最新帧槽位（latest-wins）
+
+    接收循环持续读取帧并覆盖槽位中尚未被取走的旧帧，处理任务每次取走最新的一帧，
+    推理较慢时客户端的积压帧被丢弃，而不是排队放大延迟。
+    """
+
+    def __init__(self):
+        self._frame = None
+        self._ready = asyncio.Event()
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+
+    def put(self, frame: _Frame):
+        if self._frame is not None:
+            self.dropped += 1
+            metrics.FRAMES_DROPPED.inc()
+        self._frame = frame
+        self.received += 1
+        self._ready.set()
+
+    async def take(self) -> _Frame:
+        await self._ready.wait()
+        self._ready.clear()
+        frame, self._frame = self._frame, None
+        return frame
 
-MAX_PENDING_FRAMES = 2
+# TTS 语音流 id，标识二进制音频分片属于哪一条播报
+_tts_stream_ids = itertools.count(1)
 
 
-async def _send_tts_async(websocket: WebSocket, text: str, loop: asyncio.AbstractEventLoop):
+async def _send_tts_async(websocket: WebSocket, text: str, codec: str = "pcm"):
     try:
-        audio_data = await loop.run_in_executor(_tts_executor, tts_handler.synthesize_speech, text)
+        audio_data = await tts_handler.synthesize_speech_async(text, codec=codec)
         if audio_data:
             audio_b64 = base64.b64encode(audio_data).decode('utf-8')
             await manager.send_message(websocket, {
                 "type": "tts",
                 "audio": audio_b64,
-                "text": text
+                "text": text,
+                "codec": codec
             })
     except Exception as e:
         logger.error(f"TTS error: {e}")
 
 
-async def handle_websocket(websocket: WebSocket, detector):
+async def _stream_tts_async(websocket: WebSocket, text: str, codec: str = "pcm"):
+    """流式播报：音频分片到达即以二进制消息下发，首个分片即可开始播放"""
+    stream_id = next(_tts_stream_ids) & 0xFFFFFFFF
+    started = False
+    try:
+        async for chunk in tts_handler.stream_speech(text, codec=codec):
+            if not started:
+                await manager.send_message(websocket, {
+                    "type": "tts_start",
+                    "id": stream_id,
+                    "text": text,
+                    "sample_rate": 24000,
+                    "codec": codec
+                })
+                started = True
+            await manager.send_bytes(websocket, pack_tts_audio(stream_id, chunk))
+    except Exception as e:
+        logger.error(f"TTS error: {e}")
+    finally:
+        if started:
+            await manager.send_message(websocket, {"type": "tts_end", "id": stream_id})
+
+
+def _parse_settings(params, settings: dict, names: list) -> dict:
+    """解析连接级推理设置（imgsz / iou / track / gate / tile / gate_ratio / classes / roi），非法值忽略并保留原设置
+
+    classes 为 class_id 或英文类别名列表，roi 为归一化的 x1,y1,x2,y2；传空值恢复为不限。
+    """
+    updated = dict(settings)
+    for key, parse in (("classes", lambda value: parse_classes(value, names)), ("roi", parse_roi)):
+        if key in params:
+            try:
+                updated[key] = parse(params[key])
+            except (TypeError, ValueError):
+                pass
+    for key in ("track", "gate", "tile"):
+        value = params.get(key)
+        if value is not None:
+            updated[key] = str(value).lower() in ("1", "true", "on")
+    try:
+        imgsz = params.get("imgsz")
+        if imgsz is not None and int(imgsz) in IMGSZ_OPTIONS:
+            updated["imgsz"] = int(imgsz)
+        iou = params.get("iou")
+        if iou is not None and 0 < float(iou) < 1:
+            updated["iou"] = float(iou)
+        gate_ratio = params.get("gate_ratio")
+        if gate_ratio is not None and 0 < float(gate_ratio) < 1:
+            updated["gate_ratio"] = float(gate_ratio)
+    except (TypeError, ValueError):
+        pass
+    return updated
+
+
+async def handle_websocket(websocket: WebSocket, scheduler):
     await manager.connect(websocket)
 
-    latest_image_bytes = None
-    latest_confidence = 0.25
-    is_processing = False
-    pending_count = 0
-    loop = asyncio.get_event_loop()
+    # 客户端通过 ?format=binary 协商二进制结果格式，否则使用 JSON
+    binary_results = websocket.query_params.get("format") == "binary"
+    if binary_results:
+        # 类别名称只在连接时下发一次，结果消息中仅携带 class_id
+        await manager.send_message(websocket, {
+            "type": "classes",
+            "classes": scheduler.detector.get_classes()
+        })
+    # 二进制连接默认流式下发 TTS 音频，JSON 连接仍整段 base64 下发
+    stream_tts = binary_results and tts_handler.get_tts_config().get('streaming', True)
+    # 客户端通过 ?tts_codec=adpcm 协商压缩音频，默认原始 PCM
+    tts_codec = websocket.query_params.get("tts_codec", "pcm")
+    if tts_codec not in CODEC_OPTIONS:
+        tts_codec = "pcm"
+
+    # 连接级推理设置，None 表示使用服务端默认值；可通过查询参数或 config 消息修改。
+    # imgsz 在连接建立时取一次服务端默认值，之后 POST /api/config 修改默认值不影响已建立的连接
+    tracking_config = get_section('tracking')
+    gate_config = get_section('motion_gate')
+    tiling_config = get_section('tiling')
+    tile_spec = TileSpec.from_config(tiling_config)
+    settings = _parse_settings(websocket.query_params, {
+        "imgsz": scheduler.detector.imgsz,
+        "iou": None,
+        "track": tracking_config.get('enabled', False),
+        "gate": gate_config.get('enabled', False),
+        "tile": tiling_config.get('enabled', False),
+        "gate_ratio": gate_config.get('changed_ratio', 0.01),
+        "classes": None,
+        "roi": None
+    }, scheduler.detector.names_en)
+
+    rate_config = get_section('rate_control')
+    rate_controller = None
+    if rate_config.get('enabled', True):
+        rate_controller = RateController(
+            scheduler,
+            max_fps=rate_config.get('max_fps', 15),
+            min_fps=rate_config.get('min_fps', 1),
+            downscale_fps=rate_config.get('downscale_fps', 5),
+            min_imgsz=rate_config.get('min_imgsz', 160),
+            interval=rate_config.get('interval', 1.0)
+        )
+
+    # 接收与处理解耦：接收循环只把帧放入最新帧槽位，处理任务逐帧取出处理
+    slot = _FrameSlot()
+    # 未带序号的帧由服务端编号
+    frame_id = 0
+    latency_total = 0.0
 
     # TTS 状态：class_name -> {count: int, last_seen: float}
     # count: 已播报的该类别数量
@@ -75,82 +229,219 @@ async def handle_websocket(websocket: WebSocket, detector):
     # 只在 count 增加时播报，消失超过 ABSENCE_THRESHOLD 后重置
     active_tts = {}
 
-    try:
+    # 跟踪开启时改为按轨迹 id 判定播报；detect_interval > 1 时中间帧由运动预测给出，不做推理
+    tracker = None
+    announcer = None
+    detect_interval = max(1, int(tracking_config.get('detect_interval', 1)))
+    frames_since_detect = 0
+
+    # 画面变化门控：画面未变化时复用上一次的检测结果（跟踪前的原始结果及其置信度阈值）
+    gate = None
+    last_detection = None
+    last_detection_conf = None
+
+    async def process_frame(frame: _Frame):
+        nonlocal tracker, announcer, gate, frames_since_detect
+        nonlocal last_detection, last_detection_conf, latency_total
+        started_at = time.perf_counter()
+
+        if settings["track"] and tracker is None:
+            tracker = Tracker(
+                iou_threshold=tracking_config.get('iou_threshold', 0.3),
+                high_score=tracking_config.get('high_score', 0.5),
+                max_age=tracking_config.get('max_age', 1.0),
+                min_hits=tracking_config.get('min_hits', 2)
+            )
+            announcer = TrackAnnouncer(ABSENCE_THRESHOLD)
+        elif not settings["track"]:
+            tracker = announcer = None
+
+        if settings["gate"]:
+            if gate is None:
+                gate = MotionGate(
+                    pixel_threshold=gate_config.get('pixel_threshold', 25),
+                    refresh_interval=gate_config.get('refresh_interval', 2.0)
+                )
+            gate.changed_ratio = settings["gate_ratio"]
+        elif gate is not None:
+            logger.info(f"Motion gate stats: {gate.get_stats()}")
+            gate = None
+
+        now = time.time()
+        predict = tracker is not None and frames_since_detect < detect_interval - 1 \
+            and tracker.has_tracks()
+        unchanged = False
+        if gate is not None and not predict:
+            # 置信度阈值变了的话旧结果不可复用，但仍要生成参考帧缩略图
+            reusable = last_detection is not None and frame.conf == last_detection_conf
+            unchanged = await asyncio.to_thread(gate.should_skip, frame.image, now, reusable)
+            metrics.GATE_FRAMES.inc()
+
+        if predict:
+            # 跳帧：不解码不推理，按运动模型外推已确认轨迹的位置
+            result = tracker.predict(now)
+            frames_since_detect += 1
+            metrics.SKIPPED_PREDICT.inc()
+        elif unchanged:
+            # 画面未变化：复用上次检测结果，跟踪器照常更新以保持轨迹存活
+            result = last_detection
+            metrics.SKIPPED_GATE.inc()
+            if tracker is not None:
+                result = tracker.update(result, now)
+        else:
+            ceiling_imgsz = settings["imgsz"]
+            imgsz = ceiling_imgsz
+            if rate_controller is not None and rate_controller.imgsz:
+                # 负载高时服务端按控制器建议降低本连接的推理尺寸
+                imgsz = min(rate_controller.imgsz, ceiling_imgsz)
+
+            submitted_at = time.perf_counter()
+            result = await scheduler.submit(
+                frame.image, frame.conf, columnar=True, imgsz=imgsz, iou=settings["iou"],
+                classes=settings["classes"], roi=settings["roi"],
+                tile=tile_spec if settings["tile"] else None
+            )
+            frames_since_detect = 0
+            last_detection = result
+            last_detection_conf = frame.conf
+
+            if rate_controller is not None:
+                rate_message = rate_controller.update(
+                    time.perf_counter() - submitted_at, ceiling_imgsz,
+                    len(manager.active_connections)
+                )
+                if rate_message is not None:
+                    await manager.send_message(websocket, rate_message)
+
+            now = time.time()
+            if gate is not None:
+                gate.commit(now)
+            if tracker is not None:
+                result = tracker.update(result, now)
+
+        names_cn = scheduler.detector.names_cn
+        current_counts = Counter(
+            names_cn[class_id] for class_id in result["class_ids"]
+        ) if tracker is None else {}
+
+        expired = [
+            cls for cls, state in active_tts.items()
+            if cls not in current_counts
+            and now - state['last_seen'] > ABSENCE_THRESHOLD
+        ]
+        for cls in expired:
+            del active_tts[cls]
+
+        speak_items = []
+        if announcer is not None:
+            # 同一帧新出现多个同类物体只播报一次
+            speak_items = list(dict.fromkeys(
+                names_cn[class_id]
+                for class_id in announcer.update(tracker.confirmed, now)
+            ))
+        for cls, count in current_counts.items():
+            if cls in active_tts:
+                active_tts[cls]['last_seen'] = now
+                if count > active_tts[cls]['count']:
+                    # 同类物体数量增加（放入了新的同类物体）
+                    speak_items.append(cls)
+                    active_tts[cls]['count'] = count
+            else:
+                # 全新类别，或消失足够久后重新出现
+                active_tts[cls] = {'count': count, 'last_seen': now}
+                speak_items.append(cls)
+
+        if speak_items and tts_handler.get_tts_config().get('enabled', False):
+            for class_name in speak_items:
+                text = tts_handler.announcement_text(class_name)
+                if stream_tts:
+                    asyncio.create_task(_stream_tts_async(websocket, text, tts_codec))
+                else:
+                    asyncio.create_task(_send_tts_async(websocket, text, tts_codec))
+
+        # 时间均为服务端测量：wait 为帧在槽位中等待处理的时长，server 为收到帧到结果发出的总耗时
+        wait_ms = (started_at - frame.received_at) * 1000
+        server_ms = (time.perf_counter() - frame.received_at) * 1000
+        latency_total += server_ms
+        sent_at = time.perf_counter()
+        if binary_results:
+            # 只有带序号的帧（客户端能据此匹配结果）才追加时间信息
+            timing = None
+            if frame.client_ts is not None:
+                timing = (frame.client_ts, frame.received_ts, wait_ms, server_ms)
+            await manager.send_bytes(websocket, pack_result(frame.seq, result, timing))
+        else:
+            records = scheduler.detector.to_records(result)
+            payload = {
+                "type": "result",
+                "frame_id": frame.seq,
+                "detections": records["detections"],
+                "width": records["width"],
+                "height": records["height"],
+                "server_ts": frame.received_ts,
+                "wait_ms": round(wait_ms, 2),
+                "server_ms": round(server_ms, 2)
+            }
+            if frame.client_ts is not None:
+                payload["client_ts"] = frame.client_ts
+            await manager.send_message(websocket, payload)
+        finished_at = time.perf_counter()
+        metrics.SEND_SECONDS.observe(finished_at - sent_at)
+        metrics.FRAME_WAIT_SECONDS.observe(wait_ms / 1000)
+        metrics.FRAME_SECONDS.observe(finished_at - frame.received_at)
+
+    async def process_frames():
         while True:
+            frame = await slot.take()
             try:
-                message = await asyncio.wait_for(websocket.receive_bytes(), timeout=1.0)
-            except asyncio.TimeoutError:
-                await asyncio.sleep(0)
+                await process_frame(frame)
+                metrics.FRAMES_PROCESSED.inc()
+            except Exception as e:
+                metrics.FRAMES_FAILED.inc()
+                logger.error(f"Detection error: {e}")
+                # 客户端等待每帧结果后才发送下一帧，失败的帧也要回复，否则客户端停止发送
+                await manager.send_message(websocket, {
+                    "type": "error", "frame_id": frame.seq, "error": str(e)
+                })
+            slot.processed += 1
+
+    processor = asyncio.create_task(process_frames())
+
+    try:
+        while True:
+            raw = await websocket.receive()
+
+            if raw["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(raw.get("code", 1000))
+
+            # 文本消息为 JSON 控制消息：{"type": "config", "imgsz": 160, "iou": 0.5}
+            if raw.get("text"):
+                try:
+                    control = json.loads(raw["text"])
+                except ValueError:
+                    continue
+                if control.get("type") == "config":
+                    settings = _parse_settings(control, settings, scheduler.detector.names_en)
+                    # 推理设置变化后旧结果不再可复用
+                    last_detection = None
+                    await manager.send_message(websocket, {"type": "config", **settings})
                 continue
 
-            if message and len(message) > 0:
-                msg_type = message[0]
-
-                if msg_type == 0x01:
-                    conf_int = message[1] if len(message) > 1 else 25
-                    latest_confidence = conf_int / 100.0
-                    image_bytes = message[2:] if len(message) > 2 else message[1:]
-                    latest_image_bytes = image_bytes
-
-                    if pending_count >= MAX_PENDING_FRAMES:
-                        continue
-
-                    if not is_processing and latest_image_bytes:
-                        is_processing = True
-                        pending_count += 1
-
-                        try:
-                            result = await loop.run_in_executor(
-                                _detect_executor, detector.detect, latest_image_bytes, latest_confidence
-                            )
-                            detections = result.get("detections", [])
-                            img_w = result.get("width", 0)
-                            img_h = result.get("height", 0)
-
-                            now = time.time()
-                            current_counts = Counter(
-                                d.get("class_name_cn") for d in detections
-                                if d.get("class_name_cn")
-                            )
-
-                            expired = [
-                                cls for cls, state in active_tts.items()
-                                if cls not in current_counts
-                                and now - state['last_seen'] > ABSENCE_THRESHOLD
-                            ]
-                            for cls in expired:
-                                del active_tts[cls]
-
-                            speak_items = []
-                            for cls, count in current_counts.items():
-                                if cls in active_tts:
-                                    active_tts[cls]['last_seen'] = now
-                                    if count > active_tts[cls]['count']:
-                                        # 同类物体数量增加（放入了新的同类物体）
-                                        speak_items.append(cls)
-                                        active_tts[cls]['count'] = count
-                                else:
-                                    # 全新类别，或消失足够久后重新出现
-                                    active_tts[cls] = {'count': count, 'last_seen': now}
-                                    speak_items.append(cls)
-
-                            if speak_items and tts_handler.get_tts_config().get('enabled', False):
-                                for class_name in speak_items:
-                                    text = f"我看到了{class_name}"
-                                    asyncio.create_task(_send_tts_async(websocket, text, loop))
-
-                            await manager.send_message(websocket, {
-                                "type": "result",
-                                "detections": detections,
-                                "width": img_w,
-                                "height": img_h
-                            })
-
-                        except Exception as e:
-                            logger.error(f"Detection error: {e}")
-                        finally:
-                            pending_count -= 1
-                            is_processing = False
+            message = raw.get("bytes")
+
+            if message and message[0] in (MSG_FRAME, MSG_FRAME_SEQ):
+                try:
+                    seq, conf, client_ts, image_bytes = unpack_frame(message)
+                except ValueError as e:
+                    metrics.FRAMES_MALFORMED.inc()
+                    logger.warning(f"Malformed frame: {e}")
+                    continue
+                if not image_bytes:
+                    continue
+                if seq is None:
+                    frame_id = (frame_id + 1) & 0xFFFFFFFF
+                    seq = frame_id
+                slot.put(_Frame(seq, conf, image_bytes, client_ts, time.perf_counter(), time.time() * 1000))
 
     except WebSocketDisconnect:
         manager.disconnect(websocket)
@@ -158,3 +449,12 @@ async def handle_websocket(websocket: WebSocket, detector):
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
         manager.disconnect(websocket)
+    finally:
+        processor.cancel()
+        if slot.processed:
+            logger.info(
+                f"Frame stats: received={slot.received} processed={slot.processed} "
+                f"dropped={slot.dropped} avg_server_ms={latency_total / slot.processed:.1f}"
+            )
+        if gate is not None:
+            logger.info(f"Motion gate stats: {gate.get_stats()}")
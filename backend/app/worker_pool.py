@@ -0,0 +1,404 @@
+import os
+import time
+import queue
+import asyncio
+import logging
+import threading
+import numpy as np
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from concurrent.futures import ThreadPoolExecutor
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# 每个共享内存槽位的初始大小，足以容纳 1080p JPEG 帧
+DEFAULT_SLOT_BYTES = 4 * 1024 * 1024
+# 遇到更大的帧（如 1080p 以上的解码视频帧）时按 1MB 对齐扩大槽位，最大到 4K BGR 帧的大小
+SLOT_ALIGN = 1024 * 1024
+MAX_SLOT_BYTES = 3840 * 2160 * 3
+# 等待工作进程结果时检查其存活状态的间隔（秒）
+RESULT_POLL_INTERVAL = 0.5
+# 单个工作进程连续退出超过此次数后不再重启
+MAX_RESTARTS = 3
+
+
+class WorkerDiedError(RuntimeError):
+    """工作进程在处理任务期间退出（OOM、段错误、被 kill 等）"""
+
+
+def resolve_worker_count(workers) -> int:
+    """解析 inference.workers 配置：auto / N，0 表示使用进程内执行器"""
+    if workers is None:
+        return 0
+    if isinstance(workers, str):
+        if workers.strip().lower() == 'auto':
+            return max(1, (os.cpu_count() or 1) // 2)
+        workers = int(workers)
+    return max(0, int(workers))
+
+
+def _worker_main(model_path: str, detector_kwargs: dict, shm_name: str, slot_bytes: int,
+                 torch_threads: int, task_queue, result_queue):
+    """工作进程入口：持有独立的 YOLODetector，从共享内存槽位读取帧"""
+    import torch
+    torch.set_num_threads(torch_threads)
+
+    from .detector import YOLODetector
+    detector = YOLODetector(model_path, **detector_kwargs)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    result_queue.put(("ready", None))
+
+    try:
+        while True:
+            task = task_queue.get()
+            if task is None:
+                break
+            kind = task[0]
+            if kind == "warmup":
+                try:
+                    result_queue.put(("ok", detector.warmup(task[1])))
+                except Exception as e:
+                    result_queue.put(("error", str(e)))
+                continue
+            if kind == "remap":
+                # 主进程扩大了槽位：先映射新的共享内存再释放旧的
+                try:
+                    remapped = shared_memory.SharedMemory(name=task[1])
+                except Exception as e:
+                    result_queue.put(("error", str(e)))
+                    continue
+                shm.close()
+                shm, slot_bytes = remapped, task[2]
+                result_queue.put(("ok", None))
+                continue
+            if kind == "release":
+                try:
+                    detector.release(task[1])
+                    result_queue.put(("ok", None))
+                except Exception as e:
+                    result_queue.put(("error", str(e)))
+                continue
+
+            _, frames, confs, imgsz, iou, classes, rois, tiles = task
+            images = []
+            try:
+                for frame in frames:
+                    if isinstance(frame, tuple):
+                        slot, length, shape = frame
+                        offset = slot * slot_bytes
+                        if shape is None:
+                            images.append(shm.buf[offset:offset + length])
+                        else:
+                            # 已解码的视频帧
+                            images.append(np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=offset))
+                    else:
+                        # 超出 MAX_SLOT_BYTES 的帧直接随任务传递
+                        images.append(frame)
+                results = detector.detect_batch(
+                    images, confs, columnar=True, imgsz=imgsz, iou=iou,
+                    classes=classes, rois=rois, tiles=tiles
+                )
+                # 各阶段耗时随结果带回，由主进程记录指标
+                result_queue.put(("ok", (results, detector.last_timings)))
+            except Exception as e:
+                result_queue.put(("error", str(e)))
+            finally:
+                # 不保留指向共享内存的视图，否则 remap 时无法关闭旧的映射
+                del images
+    finally:
+        shm.close()
+
+
+class _Worker:
+    def __init__(self, ctx, index: int, model_path: str, detector_kwargs: dict,
+                 num_slots: int, slot_bytes: int, torch_threads: int):
+        self.index = index
+        self.num_slots = num_slots
+        self.slot_bytes = slot_bytes
+        self.shm = shared_memory.SharedMemory(create=True, size=num_slots * slot_bytes)
+        self.task_queue = ctx.Queue()
+        self.result_queue = ctx.Queue()
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(model_path, detector_kwargs, self.shm.name, slot_bytes, torch_threads, self.task_queue, self.result_queue),
+            daemon=True
+        )
+        self.process.start()
+        self._next_slot = 0
+
+    def _get_result(self, timeout: float = None) -> tuple:
+        """等待结果，期间定期检查进程是否存活，进程退出时抛出 WorkerDiedError"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            try:
+                return self.result_queue.get(timeout=RESULT_POLL_INTERVAL)
+            except queue.Empty:
+                if not self.process.is_alive():
+                    raise WorkerDiedError(f"worker {self.index} exited with code {self.process.exitcode}")
+                if deadline is not None and time.monotonic() > deadline:
+                    raise TimeoutError(f"worker {self.index} did not respond in {timeout}s")
+
+    def wait_ready(self, timeout: float):
+        status, _ = self._get_result(timeout)
+        if status != "ready":
+            raise RuntimeError(f"worker {self.index} failed to start")
+
+    def _grow_slots(self, length: int):
+        """扩大槽位以容纳 length 字节的帧；调用时工作进程空闲，旧的共享内存可以直接释放"""
+        slot_bytes = -(-length // SLOT_ALIGN) * SLOT_ALIGN
+        shm = shared_memory.SharedMemory(create=True, size=self.num_slots * slot_bytes)
+        try:
+            self.call("remap", shm.name, slot_bytes)
+        except Exception:
+            shm.close()
+            shm.unlink()
+            raise
+        self.shm.close()
+        self.shm.unlink()
+        self.shm, self.slot_bytes = shm, slot_bytes
+        self._next_slot = 0
+        logger.info(f"Worker {self.index} shared memory slots grown to {slot_bytes // SLOT_ALIGN}MB")
+
+    def run_batch(self, images: list, confs: list, imgsz: int, iou: float,
+                  classes: list = None, rois: list = None, tiles: list = None) -> list:
+        # 已解码的视频帧按原始像素传递，worker 端按形状还原
+        shapes = [image.shape if isinstance(image, np.ndarray) else None for image in images]
+        lengths = [image.nbytes if shape is not None else len(image or b'')
+                   for image, shape in zip(images, shapes)]
+        largest = max(lengths, default=0)
+        if self.slot_bytes < largest <= MAX_SLOT_BYTES:
+            self._grow_slots(largest)
+
+        frames = []
+        for image_data, shape, length in zip(images, shapes, lengths):
+            if 0 < length <= self.slot_bytes:
+                # 环形复用槽位；每个工作进程同一时刻只处理一个批次
+                slot = self._next_slot
+                self._next_slot = (self._next_slot + 1) % self.num_slots
+                offset = slot * self.slot_bytes
+                if shape is not None:
+                    np.ndarray(shape, dtype=np.uint8, buffer=self.shm.buf, offset=offset)[...] = image_data
+                else:
+                    self.shm.buf[offset:offset + length] = image_data
+                frames.append((slot, length, shape))
+            elif shape is not None:
+                frames.append(image_data)
+            else:
+                frames.append(bytes(image_data or b''))
+
+        results, timings = self.call("detect", frames, confs, imgsz, iou, classes, rois, tiles)
+        metrics.observe_stages(timings)
+        return results
+
+    def call(self, *task):
+        self.task_queue.put(task)
+        status, payload = self._get_result()
+        if status != "ok":
+            raise RuntimeError(f"worker {self.index}: {payload}")
+        return payload
+
+    def shutdown(self):
+        try:
+            if self.process.is_alive():
+                self.task_queue.put(None)
+                self.process.join(timeout=5)
+            if self.process.is_alive():
+                self.process.terminate()
+        finally:
+            # 进程已退出时队列的后台写线程可能阻塞在管道上，不等待它
+            for q in (self.task_queue, self.result_queue):
+                q.cancel_join_thread()
+                q.close()
+            self.shm.close()
+            self.shm.unlink()
+
+
+class DetectorProcessPool:
+    """多进程推理池
+
+    每个工作进程持有独立的 YOLODetector，帧数据通过 multiprocessing.shared_memory
+    槽位传递，批次分发给空闲的工作进程以实现负载均衡。槽位初始为 slot_bytes，
+    遇到更大的帧时按需扩大（上限 MAX_SLOT_BYTES）。
+    """
+
+    def __init__(self, detector, num_workers: int, model_path: str = "yolov8n.pt",
+                 detector_kwargs: dict = None, max_batch_size: int = 8, slot_bytes: int = DEFAULT_SLOT_BYTES,
+                 start_timeout: float = 120.0):
+        self.detector = detector
+        self.num_workers = num_workers
+        torch_threads = max(1, (os.cpu_count() or 1) // num_workers)
+
+        # spawn 启动方式兼容 CUDA 且不会继承父进程的模型状态
+        ctx = mp.get_context("spawn")
+        self._worker_args = (ctx, model_path, detector_kwargs or {}, max_batch_size, slot_bytes, torch_threads)
+        self._start_timeout = start_timeout
+        self._lock = threading.Lock()
+        # 所有工作进程都无法重启后，批次在进程内串行推理
+        self._fallback_lock = threading.Lock()
+        self._closed = False
+        self._workers = []
+        try:
+            for i in range(num_workers):
+                self._workers.append(_Worker(ctx, i, *self._worker_args[1:]))
+            for worker in self._workers:
+                worker.wait_ready(start_timeout)
+        except Exception:
+            self.shutdown()
+            raise
+
+        self._restart_counts = [0] * num_workers
+        self._idle = queue.Queue()
+        for worker in self._workers:
+            self._idle.put(worker)
+        self._executor = ThreadPoolExecutor(max_workers=num_workers)
+        logger.info(f"[WorkerPool] started {num_workers} workers, torch_threads={torch_threads}")
+
+    def _acquire(self):
+        """取一个空闲的工作进程；所有进程都已移除时返回 None"""
+        while True:
+            with self._lock:
+                if not self._workers:
+                    return None
+            try:
+                return self._idle.get(timeout=RESULT_POLL_INTERVAL)
+            except queue.Empty:
+                continue
+
+    def _on_worker_died(self, worker: _Worker, error: Exception):
+        """工作进程退出：在后台线程中重启，重启期间其余进程继续处理批次"""
+        logger.error(f"[WorkerPool] {error}")
+        metrics.WORKER_RESTARTS.inc()
+        threading.Thread(target=self._replace, args=(worker,), daemon=True).start()
+
+    def _replace(self, worker: _Worker):
+        try:
+            worker.shutdown()
+        except Exception as e:
+            logger.error(f"[WorkerPool] Failed to clean up worker {worker.index}: {e}")
+
+        replacement = None
+        self._restart_counts[worker.index] += 1
+        if self._restart_counts[worker.index] <= MAX_RESTARTS and not self._closed:
+            try:
+                replacement = _Worker(self._worker_args[0], worker.index, *self._worker_args[1:])
+                replacement.wait_ready(self._start_timeout)
+            except Exception as e:
+                logger.error(f"[WorkerPool] Failed to restart worker {worker.index}: {e}")
+                if replacement is not None:
+                    replacement.shutdown()
+                replacement = None
+
+        with self._lock:
+            closed = self._closed
+            if not closed:
+                index = self._workers.index(worker)
+                if replacement is not None:
+                    self._workers[index] = replacement
+                else:
+                    del self._workers[index]
+        if closed:
+            if replacement is not None:
+                replacement.shutdown()
+            return
+        if replacement is None:
+            logger.error(f"[WorkerPool] worker {worker.index} removed, {len(self._workers)} workers left")
+            return
+        self._idle.put(replacement)
+        logger.info(f"[WorkerPool] worker {worker.index} restarted")
+
+    def _detect_in_process(self, images: list, confs: list, imgsz: int, iou: float,
+                           classes: list, rois: list, tiles: list) -> list:
+        with self._fallback_lock:
+            results = self.detector.detect_batch(
+                images, confs, columnar=True, imgsz=imgsz, iou=iou, classes=classes, rois=rois, tiles=tiles
+            )
+            metrics.observe_stages(self.detector.last_timings)
+        return results
+
+    def _call_in_process(self, kind: str, *args):
+        with self._fallback_lock:
+            return getattr(self.detector, kind)(*args)
+
+    def _run_batch(self, images: list, confs: list, imgsz: int, iou: float,
+                   classes: list = None, rois: list = None, tiles: list = None) -> list:
+        worker = self._acquire()
+        if worker is None:
+            return self._detect_in_process(images, confs, imgsz, iou, classes, rois, tiles)
+        try:
+            result = worker.run_batch(images, confs, imgsz, iou, classes, rois, tiles)
+        except WorkerDiedError as e:
+            # 本批次的请求直接失败，由调用方决定是否重试；槽位在进程重启后归还
+            self._on_worker_died(worker, e)
+            raise
+        except BaseException:
+            self._idle.put(worker)
+            raise
+        self._idle.put(worker)
+        return result
+
+    def _call_all(self, *task) -> list:
+        """在每个工作进程上执行一次任务，期间其余进程继续处理批次
+
+        执行期间退出的进程被跳过（重启后的进程在首次使用时再加载对应尺寸）。
+        """
+        done = set()
+        results = []
+        while True:
+            with self._lock:
+                pending = [w for w in self._workers if w not in done]
+            if not pending:
+                return results
+            worker = self._acquire()
+            if worker is None:
+                break
+            if worker not in pending:
+                self._idle.put(worker)
+                # 其余待执行的进程都在忙，稍后再取
+                time.sleep(0.01)
+                continue
+            done.add(worker)
+            try:
+                results.append(worker.call(*task))
+            except WorkerDiedError as e:
+                self._on_worker_died(worker, e)
+                continue
+            except BaseException:
+                self._idle.put(worker)
+                raise
+            self._idle.put(worker)
+        # 所有进程都已移除，改在进程内执行
+        return [self._call_in_process(*task)]
+
+    async def warmup(self, imgsz: int) -> dict:
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(self._executor, self._call_all, "warmup", imgsz)
+        return {
+            "warmup_ms": max((r["warmup_ms"] for r in results), default=0),
+            "memory_bytes": sum(r["memory_bytes"] for r in results)
+        }
+
+    async def release(self, imgsz: int):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._call_all, "release", imgsz)
+
+    async def detect_batch(self, images: list, confs: list, imgsz: int, iou: float,
+                           classes: list = None, rois: list = None, tiles: list = None) -> list:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, self._run_batch, images, confs, imgsz, iou, classes, rois, tiles
+        )
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            try:
+                worker.shutdown()
+            except Exception as e:
+                logger.error(f"[WorkerPool] Shutdown error: {e}")
+        executor = getattr(self, "_executor", None)
+        if executor is not None:
+            executor.shutdown(wait=False)
@@ -1,5 +1,45 @@
 import { ref } from 'vue'
 
+// IMA ADPCM 解码，与后端 app/audio_codec.py 的块格式一致：
+// 块头 samples(u32) predictor(i16) index(u8)，其后每字节低 4 位在前、高 4 位在后
+const ADPCM_HEADER_SIZE = 7
+const INDEX_TABLE = [-1, -1, -1, -1, 2, 4, 6, 8, -1, -1, -1, -1, 2, 4, 6, 8]
+const STEP_TABLE = [
+  7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41, 45,
+  50, 55, 60, 66, 73, 80, 88, 97, 107, 118, 130, 143, 157, 173, 190, 209, 230,
+  253, 279, 307, 337, 371, 408, 449, 494, 544, 598, 658, 724, 796, 876, 963,
+  1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066, 2272, 2499, 2749, 3024, 3327,
+  3660, 4026, 4428, 4871, 5358, 5894, 6484, 7132, 7845, 8630, 9493, 10442,
+  11487, 12635, 13899, 15289, 16818, 18500, 20350, 22385, 24623, 27086, 29794,
+  32767
+]
+
+const decodeAdpcm = (bytes) => {
+  const view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength)
+  const count = view.getUint32(0, true)
+  let predictor = view.getInt16(4, true)
+  let index = view.getUint8(6)
+  const samples = new Int16Array(count)
+  for (let i = 0; i < count; i++) {
+    const byte = bytes[ADPCM_HEADER_SIZE + (i >> 1)]
+    const code = i & 1 ? byte >> 4 : byte & 0x0f
+    const step = STEP_TABLE[index]
+    let delta = step >> 3
+    if (code & 4) delta += step
+    if (code & 2) delta += step >> 1
+    if (code & 1) delta += step >> 2
+    predictor += code & 8 ? -delta : delta
+    predictor = Math.max(-32768, Math.min(32767, predictor))
+    index = Math.max(0, Math.min(88, index + INDEX_TABLE[code]))
+    samples[i] = predictor
+  }
+  return samples
+}
+
+const toSamples = (raw, codec) => codec === 'adpcm'
+  ? decodeAdpcm(raw)
+  : new Int16Array(raw.buffer, raw.byteOffset, Math.floor(raw.byteLength / 2))
+
 export default function useTTS() {
   const ttsVolume = ref(parseFloat(localStorage.getItem('yolo_tts_volume') || '1'))
   let audioCtx = null
@@ -30,33 +70,56 @@ export default function useTTS() {
     } catch (_) { /* noop */ }
   }
 
-  const playPCM = (base64Data) => {
+  // 流式播报：streamId -> { codec, next: 下一个分片的开始时间 }
+  const streams = new Map()
+
+  const schedulePCM = (samples, when = 0) => {
+    const ctx = getCtx()
+    if (!samples.length) return when
+    const buffer = ctx.createBuffer(1, samples.length, 24000)
+    const channel = buffer.getChannelData(0)
+    const vol = ttsVolume.value * 3
+    for (let i = 0; i < samples.length; i++) {
+      channel[i] = (samples[i] / 32768.0) * vol
+    }
+    const src = ctx.createBufferSource()
+    src.buffer = buffer
+    src.connect(ctx.destination)
+    const start = Math.max(when, ctx.currentTime)
+    src.start(start)
+    return start + buffer.duration
+  }
+
+  const playPCM = (base64Data, codec = 'pcm') => {
     try {
-      const raw = Uint8Array.from(atob(base64Data), c => c.charCodeAt(0))
-      const ctx = getCtx()
-      const numSamples = raw.byteLength / 2
-      const buffer = ctx.createBuffer(1, numSamples, 24000)
-      const channel = buffer.getChannelData(0)
-      const samples = new Int16Array(raw.buffer, raw.byteOffset, numSamples)
-      const vol = ttsVolume.value * 3
-      for (let i = 0; i < samples.length; i++) {
-        channel[i] = (samples[i] / 32768.0) * vol
-      }
-      const src = ctx.createBufferSource()
-      src.buffer = buffer
-      src.connect(ctx.destination)
-      src.start()
+      schedulePCM(toSamples(Uint8Array.from(atob(base64Data), c => c.charCodeAt(0)), codec))
     } catch (e) {
       console.error('[TTS] Play error:', e)
     }
   }
 
+  const startStream = (streamId, codec = 'pcm') => { streams.set(streamId, { codec, next: 0 }) }
+
+  // 分片按到达顺序首尾相接排队播放
+  const playPCMChunk = (streamId, arrayBuffer) => {
+    try {
+      const stream = streams.get(streamId) || { codec: 'pcm', next: 0 }
+      stream.next = schedulePCM(toSamples(new Uint8Array(arrayBuffer), stream.codec), stream.next)
+      streams.set(streamId, stream)
+    } catch (e) {
+      console.error('[TTS] Play error:', e)
+    }
+  }
+
+  const endStream = (streamId) => { streams.delete(streamId) }
+
   const cleanup = () => {
+    streams.clear()
     if (audioCtx && audioCtx.state !== 'closed') {
       audioCtx.close()
       audioCtx = null
     }
   }
 
-  return { ttsVolume, playBeep, playPCM, cleanup }
+  return { ttsVolume, playBeep, playPCM, startStream, playPCMChunk, endStream, cleanup }
 }
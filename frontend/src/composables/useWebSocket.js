@@ -1,5 +1,22 @@
 import { ref } from 'vue'
 
+// 二进制检测结果：头部 type(u8) frameId(u32) width(u16) height(u16) count(u16)，
+// 每个检测框 bbox(4×f32) confidence(f32) classId(u16)，均为小端序
+const MSG_RESULT = 0x02
+const RESULT_HEADER_SIZE = 11
+const RESULT_RECORD_SIZE = 22
+// 开启跟踪时的检测结果：每个检测框在末尾多一个 trackId(u32)
+const MSG_TRACKED_RESULT = 0x04
+const TRACKED_RECORD_SIZE = 26
+// 带序号的帧：type(u8) confidence(u8) seq(u32) clientTs(f64)，其后为 JPEG
+const MSG_FRAME_SEQ = 0x05
+const FRAME_SEQ_HEADER_SIZE = 14
+// 带序号帧的结果在检测框之后追加：clientTs(f64) serverTs(f64) waitMs(f32) serverMs(f32)
+const RESULT_TIMING_SIZE = 24
+// 流式 TTS 音频分片：头部 type(u8) streamId(u32)，其后为 24kHz 16bit 单声道 PCM
+const MSG_TTS_AUDIO = 0x03
+const TTS_AUDIO_HEADER_SIZE = 5
+
 export default function useWebSocket() {
   const socket = ref(null)
   const connected = ref(false)
@@ -7,6 +24,55 @@ export default function useWebSocket() {
   let closeHandlers = []
   let currentConfidence = 0.25
   let wsUrl = ''
+  let classes = []
+  let frameSeq = 0
+
+  const decodeBinary = (buffer) => {
+    const view = new DataView(buffer)
+    if (view.byteLength >= TTS_AUDIO_HEADER_SIZE && view.getUint8(0) === MSG_TTS_AUDIO) {
+      return { type: 'tts_chunk', id: view.getUint32(1, true), pcm: buffer.slice(TTS_AUDIO_HEADER_SIZE) }
+    }
+    return decodeResult(view)
+  }
+
+  const decodeResult = (view) => {
+    if (view.byteLength < RESULT_HEADER_SIZE) return null
+    const msgType = view.getUint8(0)
+    if (msgType !== MSG_RESULT && msgType !== MSG_TRACKED_RESULT) return null
+    const tracked = msgType === MSG_TRACKED_RESULT
+    const frameId = view.getUint32(1, true)
+    const width = view.getUint16(5, true)
+    const height = view.getUint16(7, true)
+    const count = view.getUint16(9, true)
+    const detections = []
+    let offset = RESULT_HEADER_SIZE
+    for (let i = 0; i < count; i++) {
+      const classId = view.getUint16(offset + 20, true)
+      const cls = classes[classId] || {}
+      detections.push({
+        bbox: [
+          view.getFloat32(offset, true),
+          view.getFloat32(offset + 4, true),
+          view.getFloat32(offset + 8, true),
+          view.getFloat32(offset + 12, true)
+        ],
+        confidence: view.getFloat32(offset + 16, true),
+        class_id: classId,
+        class_name: cls.name,
+        class_name_cn: cls.name_cn,
+        ...(tracked ? { track_id: view.getUint32(offset + 22, true) } : {})
+      })
+      offset += tracked ? TRACKED_RECORD_SIZE : RESULT_RECORD_SIZE
+    }
+    const result = { type: 'result', frame_id: frameId, detections, width, height }
+    if (view.byteLength >= offset + RESULT_TIMING_SIZE) {
+      result.client_ts = view.getFloat64(offset, true)
+      result.server_ts = view.getFloat64(offset + 8, true)
+      result.wait_ms = view.getFloat32(offset + 16, true)
+      result.server_ms = view.getFloat32(offset + 20, true)
+    }
+    return result
+  }
 
   const connect = (url) => {
     return new Promise((resolve, reject) => {
@@ -25,9 +91,12 @@ export default function useWebSocket() {
         try { oldWs.close() } catch (_) { /* noop */ }
       }
 
+      // 协商二进制结果格式（类别名称在连接时下发一次）与 ADPCM 压缩的 TTS 音频
+      const binaryUrl = url + (url.includes('?') ? '&' : '?') + 'format=binary&tts_codec=adpcm'
+
       let ws
       try {
-        ws = new WebSocket(url)
+        ws = new WebSocket(binaryUrl)
       } catch (err) {
         console.error('[WS] new WebSocket() threw:', err.message)
         reject(new Error(`创建WebSocket失败: ${err.message}`))
@@ -44,8 +113,15 @@ export default function useWebSocket() {
 
       ws.onmessage = (event) => {
         try {
-          const data = JSON.parse(event.data)
-          if (data.type === 'connected') return
+          const data = event.data instanceof ArrayBuffer
+            ? decodeBinary(event.data)
+            : JSON.parse(event.data)
+          if (!data || data.type === 'connected') return
+          if (data.type === 'classes') {
+            classes = []
+            for (const c of data.classes) classes[c.id] = c
+            return
+          }
           for (const h of messageHandlers) h(data)
         } catch (_) { /* noop */ }
       }
@@ -83,14 +159,25 @@ export default function useWebSocket() {
   const setConfidence = (conf) => { currentConfidence = conf }
   const isConnected = () => socket.value?.readyState === WebSocket.OPEN
 
-  const sendFrame = (buffer) => {
+  // 连接级推理设置（imgsz / iou 等），只影响本连接
+  const sendConfig = (settings) => {
     if (!isConnected()) return
-    const confByte = Math.floor(currentConfidence * 100)
-    const header = new Uint8Array([0x01, confByte])
-    const combined = new Uint8Array(header.length + buffer.byteLength)
-    combined.set(header, 0)
-    combined.set(new Uint8Array(buffer), header.length)
+    socket.value.send(JSON.stringify({ type: 'config', ...settings }))
+  }
+
+  // 返回本帧序号，结果中的 frame_id 与之对应
+  const sendFrame = (buffer) => {
+    if (!isConnected()) return 0
+    frameSeq = (frameSeq + 1) >>> 0
+    const combined = new Uint8Array(FRAME_SEQ_HEADER_SIZE + buffer.byteLength)
+    const header = new DataView(combined.buffer)
+    header.setUint8(0, MSG_FRAME_SEQ)
+    header.setUint8(1, Math.floor(currentConfidence * 100))
+    header.setUint32(2, frameSeq, true)
+    header.setFloat64(6, performance.now(), true)
+    combined.set(new Uint8Array(buffer), FRAME_SEQ_HEADER_SIZE)
     socket.value.send(combined.buffer)
+    return frameSeq
   }
 
   const onMessage = (handler) => { messageHandlers.push(handler) }
@@ -101,5 +188,5 @@ export default function useWebSocket() {
     closeHandlers = []
   }
 
-  return { connected, connect, disconnect, sendFrame, setConfidence, onMessage, onClose, isConnected, cleanup }
+  return { connected, connect, disconnect, sendFrame, setConfidence, sendConfig, onMessage, onClose, isConnected, cleanup }
 }